@@ -1,5 +1,8 @@
 import os
+import queue
+import atexit
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from flask import Flask
 from dotenv import load_dotenv
 
@@ -10,22 +13,36 @@ from routes.clients import clients_bp
 # Importa o scheduler
 from services.scheduler import init_scheduler, get_scheduler_status
 
+from utils.json_provider import ORJSONProvider
+from config import settings
+
 # Carrega configurações
 load_dotenv()
 
 # Configuração de logging
+# Os handlers recebem os registros por uma fila: a escrita no stream acontece
+# numa thread separada, fora do caminho das requisições.
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     datefmt='%Y-%m-%d %H:%M:%S'
 )
+_root_logger = logging.getLogger()
+_log_queue = queue.Queue(-1)
+_log_listener = QueueListener(_log_queue, *_root_logger.handlers, respect_handler_level=True)
+_root_logger.handlers = [QueueHandler(_log_queue)]
+_log_listener.start()
+atexit.register(_log_listener.stop)
 
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 # Configurações de Segurança do Flask
-app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'fallback_inseguro_apenas_dev')
+app.config['SECRET_KEY'] = settings().flask_secret_key
+# Limite do corpo das requisições: payloads maiores são rejeitados (413) antes do parse
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 64 * 1024))
 
 # Registra as rotas (Entrada de Dados)
 # Agora sua API responderá em: http://localhost:5000/api/webhook
@@ -63,6 +80,8 @@ def init_app_scheduler():
 init_app_scheduler()
 
 if __name__ == '__main__':
-    # Em produção (Render), o host deve ser 0.0.0.0
+    # Servidor de desenvolvimento (apenas local).
+    # Em produção (Render) o app roda via Gunicorn: ver Procfile e gunicorn.conf.py
     port = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    debug = os.getenv("FLASK_DEBUG", "false").lower() == "true"
+    app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
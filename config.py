@@ -0,0 +1,43 @@
+"""
+Configurações obrigatórias da aplicação.
+
+Lidas do ambiente (.env) uma única vez; se alguma variável obrigatória estiver
+ausente a aplicação não sobe, em vez de falhar (ou aceitar tráfego sem token)
+só quando a primeira requisição chegar.
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from dotenv import load_dotenv
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Valores de configuração resolvidos no startup."""
+    supabase_url: str
+    supabase_key: str
+    api_secret_token: str
+    flask_secret_key: str
+
+
+@lru_cache(maxsize=None)
+def settings() -> Settings:
+    """
+    Retorna as configurações da aplicação (carregadas na primeira chamada).
+    
+    Raises:
+        ValueError: Se alguma variável obrigatória não estiver definida
+    """
+    load_dotenv()
+
+    required = ("SUPABASE_URL", "SUPABASE_KEY", "API_SECRET_TOKEN")
+    missing = [name for name in required if not os.getenv(name)]
+    if missing:
+        raise ValueError(f"❌ ERRO CRÍTICO: Variáveis obrigatórias não configuradas no .env: {', '.join(missing)}")
+
+    return Settings(
+        supabase_url=os.environ["SUPABASE_URL"],
+        supabase_key=os.environ["SUPABASE_KEY"],
+        api_secret_token=os.environ["API_SECRET_TOKEN"],
+        flask_secret_key=os.getenv("FLASK_SECRET_KEY", "fallback_inseguro_apenas_dev")
+    )
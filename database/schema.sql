@@ -21,7 +21,8 @@ BEGIN
         ADD COLUMN IF NOT EXISTS proxima_acao TIMESTAMPTZ,
         ADD COLUMN IF NOT EXISTS ultima_acao TIMESTAMPTZ,
         ADD COLUMN IF NOT EXISTS observacoes TEXT,
-        ADD COLUMN IF NOT EXISTS cpf VARCHAR(11);
+        ADD COLUMN IF NOT EXISTS cpf VARCHAR(11),
+        ADD COLUMN IF NOT EXISTS last_followup_at TIMESTAMPTZ;
     ELSE
         RAISE NOTICE 'Tabela clientes não existe — pulei adição de colunas.';
     END IF;
@@ -110,6 +111,40 @@ END $$;
 CREATE INDEX IF NOT EXISTS idx_clientes_data_compra ON clientes(data_primeira_compra) 
     WHERE data_primeira_compra IS NOT NULL;
 
+-- Ordenação da listagem paginada da API (/api/clients)
+DO $$ 
+BEGIN 
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns 
+        WHERE table_name = 'clientes' AND column_name = 'created_at'
+    ) THEN
+        EXECUTE 'CREATE INDEX IF NOT EXISTS idx_clientes_created_at ON clientes(created_at DESC);';
+    ELSE
+        RAISE NOTICE 'Coluna clientes.created_at não encontrada — pulei índice idx_clientes_created_at.';
+    END IF;
+END $$;
+
+-- Constraint única em telefone (usada no upsert idempotente dos webhooks)
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name = 'clientes' AND column_name = 'telefone') THEN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_constraint c JOIN pg_class t ON c.conrelid = t.oid
+            WHERE c.conname = 'uniq_clientes_telefone' AND t.relname = 'clientes'
+        ) THEN
+            IF EXISTS (SELECT telefone FROM clientes GROUP BY telefone HAVING COUNT(*) > 1) THEN
+                -- Só avisa: abortar aqui impediria o restante do script. Sem a
+                -- constraint o backend cai para insert sem deduplicar (42P10)
+                RAISE NOTICE 'Há telefones duplicados em clientes — remova as duplicatas e rode o script de novo para criar uniq_clientes_telefone. Para listá-las: SELECT telefone, COUNT(*) FROM clientes GROUP BY telefone HAVING COUNT(*) > 1;';
+            ELSE
+                ALTER TABLE clientes ADD CONSTRAINT uniq_clientes_telefone UNIQUE (telefone);
+            END IF;
+        END IF;
+    ELSE
+        RAISE NOTICE 'Coluna clientes.telefone não encontrada — pulei constraint uniq_clientes_telefone.';
+    END IF;
+END $$;
+
 -- Índice/constraint para CPF (único quando presente)
 DO $$
 BEGIN
@@ -336,6 +371,7 @@ BEGIN
             COMMENT ON COLUMN clientes.data_primeira_compra IS 'Data da primeira compra do cliente - Usado para calcular próximas ações';
             COMMENT ON COLUMN clientes.proxima_acao IS 'Data/hora da próxima ação programada para este cliente';
             COMMENT ON COLUMN clientes.ultima_acao IS 'Data/hora da última ação realizada com sucesso';
+            COMMENT ON COLUMN clientes.last_followup_at IS 'Data/hora do último acompanhamento automático enviado (job diário)';
             COMMENT ON COLUMN clientes.valor_pago IS 'Valor pago pelo cliente na primeira compra - Deve ser >= 0';
             COMMENT ON COLUMN clientes.procedimento IS 'Tipo de procedimento realizado pelo cliente';
         EXCEPTION 
@@ -451,6 +487,86 @@ FROM clientes c;
 
 COMMENT ON VIEW vw_clientes_proxima_acao IS 'View para facilitar filtro de clientes que precisam de ação ou têm ligação pendente';
 
+-- View: Auditoria Recente (para aba de logs do painel)
+-- Trunca dados_novos em 300 caracteres no banco: o JSON completo não trafega até o painel
+CREATE OR REPLACE VIEW vw_auditoria_recente AS
+SELECT 
+    au.id_auditoria,
+    au.data_operacao,
+    au.tabela_afetada,
+    au.operacao,
+    au.id_registro,
+    au.usuario,
+    CASE 
+        WHEN length(au.dados_novos::text) > 300 THEN left(au.dados_novos::text, 300) || '...'
+        ELSE au.dados_novos::text
+    END AS dados_novos
+FROM auditoria au
+ORDER BY au.data_operacao DESC;
+
+COMMENT ON VIEW vw_auditoria_recente IS 'Últimos registros de auditoria com dados_novos truncado - Usado na aba de logs do painel';
+
+-- ============================================
+-- 12. RPC: AÇÕES DO FORMULÁRIO DO PAINEL
+-- ============================================
+
+-- Registra, em uma única chamada (e transação), o que o formulário do painel
+-- fazia em até 4 requisições: ação imediata, ação de compra e resumo do cliente.
+-- A ação de compra é opcional: se for rejeitada por uma CHECK, o restante é mantido.
+CREATE OR REPLACE FUNCTION registrar_acoes_cliente(
+    p_id_cliente BIGINT,
+    p_acao JSONB DEFAULT NULL,
+    p_compra JSONB DEFAULT NULL,
+    p_atualizacao JSONB DEFAULT NULL
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_id_acao BIGINT;
+    v_id_compra BIGINT;
+BEGIN
+    IF p_acao IS NOT NULL THEN
+        INSERT INTO acoes (id_cliente, tipo, conteudo, data, resultado)
+        VALUES (
+            p_id_cliente,
+            p_acao->>'tipo',
+            p_acao->>'conteudo',
+            COALESCE((p_acao->>'data')::timestamptz, NOW()),
+            COALESCE(p_acao->>'resultado', 'pendente')
+        )
+        RETURNING id INTO v_id_acao;
+    END IF;
+
+    IF p_compra IS NOT NULL THEN
+        BEGIN
+            INSERT INTO acoes (id_cliente, tipo, conteudo, data, resultado)
+            VALUES (
+                p_id_cliente,
+                p_compra->>'tipo',
+                p_compra->>'conteudo',
+                COALESCE((p_compra->>'data')::timestamptz, NOW()),
+                COALESCE(p_compra->>'resultado', 'comprou')
+            )
+            RETURNING id INTO v_id_compra;
+        EXCEPTION 
+            WHEN check_violation THEN
+                RAISE NOTICE 'Ação de compra rejeitada para o cliente %: %', p_id_cliente, SQLERRM;
+        END;
+    END IF;
+
+    IF p_atualizacao IS NOT NULL THEN
+        UPDATE clientes SET
+            procedimento = COALESCE(p_atualizacao->>'procedimento', procedimento),
+            valor_pago = COALESCE((p_atualizacao->>'valor_pago')::numeric, valor_pago),
+            ultima_acao = COALESCE((p_atualizacao->>'ultima_acao')::timestamptz, ultima_acao)
+        WHERE id = p_id_cliente;
+    END IF;
+
+    RETURN jsonb_build_object('id_acao', v_id_acao, 'id_compra', v_id_compra);
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION registrar_acoes_cliente(BIGINT, JSONB, JSONB, JSONB) IS 'Ação imediata + ação de compra + resumo do cliente em uma chamada - Usado no formulário do painel';
+
 -- ============================================
 -- FIM DO SCRIPT
 -- ============================================
@@ -0,0 +1,40 @@
+"""
+Configuração do Gunicorn para produção (Render).
+
+O webhook e a listagem de clientes passam quase todo o tempo esperando o
+Supabase (I/O de rede), então usamos workers assíncronos (gevent): um único
+processo mantém centenas de requisições em voo ao mesmo tempo.
+
+O worker gevent aplica o monkey-patch (sockets cooperativos) antes de carregar
+o app, então não é necessário chamar `monkey.patch_all()` em `app.py`.
+Com isso as funções de `services/database_service.py` continuam síncronas: cada
+chamada ao Supabase bloqueia apenas o seu greenlet, e as demais requisições
+seguem sendo atendidas enquanto ela espera a rede.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# IMPORTANTE: cada worker inicializa seu próprio scheduler (ver app.py).
+# Com mais de 1 worker a automação diária rodaria em duplicidade, por isso o
+# padrão é 1 processo e a concorrência vem das conexões do gevent.
+# Para escalar, aumente WEB_CONCURRENCY (ex.: 2*CPUs+1) e mova o scheduler
+# para um worker separado.
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+
+# Máximo de requisições simultâneas por worker (apenas workers assíncronos)
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+# Para o worker "gthread" (alternativa sem gevent), ajuste o número de threads
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+
+# Mantém conexões HTTP abertas entre requisições do mesmo cliente
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "30"))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = 30
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
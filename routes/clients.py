@@ -1,26 +1,95 @@
 import logging
-from flask import Blueprint, jsonify, request
-from services.database_service import get_all_clients
+import orjson
+from flask import Blueprint, Response, jsonify, request
+from services.database_service import get_all_clients, get_client_by_id
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
 
 clients_bp = Blueprint('clients', __name__)
 
+# Paginação da listagem
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Tamanho das páginas buscadas no Supabase durante o streaming NDJSON
+STREAM_PAGE_SIZE = 500
+
+# Colunas retornadas na listagem (evita trafegar campos de texto livre)
+LIST_COLUMNS = 'id,nome,telefone,email,status,created_at'
+
+# Colunas retornadas no detalhe de um cliente
+DETAIL_COLUMNS = (
+    'id,nome,telefone,email,cpf,status,data_primeira_compra,procedimento,'
+    'valor_pago,proxima_acao,ultima_acao,observacoes,created_at'
+)
+
+
+def _stream_clients(rows):
+    """
+    Gera todos os clientes em NDJSON (um JSON por linha), página a página.
+
+    Recebe a primeira página já buscada (falhas nela viram 500 antes de a
+    resposta começar). As seguintes são buscadas por keyset (created_at, id);
+    se uma delas falhar, a última linha é {"error": ...}, para o cliente não
+    confundir o corpo truncado com a lista completa.
+    """
+    while True:
+        for row in rows:
+            yield orjson.dumps(row) + b"\n"
+        if len(rows) < STREAM_PAGE_SIZE:
+            return
+        last = rows[-1]
+        rows, error = get_all_clients(columns=LIST_COLUMNS, limit=STREAM_PAGE_SIZE,
+                                      after=(last['created_at'], last['id']))
+        if error:
+            logger.error("Erro ao buscar clientes (stream, após id %s): %s", last['id'], error)
+            yield orjson.dumps({"error": error}) + b"\n"
+            return
+
+
 @clients_bp.route('/clients', methods=['GET'])
 def list_clients():
     """
-    Retorna a lista de clientes do banco de dados.
+    Retorna uma página de clientes do banco de dados (mais recentes primeiro).
     Pode ser usado para integrações futuras ou debug.
+
+    Query params:
+    - limit: tamanho da página (padrão 50, máximo 500)
+    - offset: posição inicial (padrão 0)
+    - format=ndjson: devolve todos os clientes em streaming, um JSON por linha
+      (também ativado por "Accept: application/x-ndjson")
     """
+    if (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == 'application/x-ndjson'):
+        rows, error = get_all_clients(columns=LIST_COLUMNS, limit=STREAM_PAGE_SIZE)
+        if error:
+            logger.error("Erro ao buscar clientes (stream): %s", error)
+            return jsonify({"error": error}), 500
+        return Response(_stream_clients(rows), mimetype='application/x-ndjson')
+
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    offset = max(0, offset)
+
     try:
-        clients, error = get_all_clients()
+        clients, error = get_all_clients(columns=LIST_COLUMNS, limit=limit, offset=offset)
         if error:
-            logger.error(f"Erro ao buscar clientes: {error}")
+            logger.error("Erro ao buscar clientes: %s", error)
             return jsonify({"error": error}), 500
-        return jsonify(clients), 200
+        next_offset = offset + limit if len(clients) == limit else None
+        response = jsonify({
+            "data": clients,
+            "limit": limit,
+            "offset": offset,
+            "next_offset": next_offset
+        })
+        # ETag do conteúdo: clientes que repetem a consulta recebem 304 sem corpo
+        response.add_etag()
+        return response.make_conditional(request)
     except Exception as e:
-        logger.error(f"Erro inesperado ao listar clientes: {str(e)}")
+        logger.error("Erro inesperado ao listar clientes: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @clients_bp.route('/clients/<int:client_id>', methods=['GET'])
@@ -29,12 +98,14 @@ def get_client(client_id):
     Retorna um cliente específico pelo ID.
     """
     try:
-        from services.database_service import supabase
-        response = supabase.table('clientes').select('*').eq('id', client_id).execute()
-        if response.data:
-            return jsonify(response.data[0]), 200
-        logger.warning(f"Cliente não encontrado: ID {client_id}")
+        client, error = get_client_by_id(client_id, columns=DETAIL_COLUMNS)
+        if error:
+            logger.error("Erro ao buscar cliente %s: %s", client_id, error)
+            return jsonify({"error": error}), 500
+        if client:
+            return jsonify(client), 200
+        logger.warning("Cliente não encontrado: ID %s", client_id)
         return jsonify({"error": "Cliente não encontrado"}), 404
     except Exception as e:
-        logger.error(f"Erro ao buscar cliente {client_id}: {str(e)}")
+        logger.error("Erro ao buscar cliente %s: %s", client_id, e)
         return jsonify({"error": str(e)}), 500
\ No newline at end of file
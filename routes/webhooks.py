@@ -1,9 +1,13 @@
 import os
+import hmac
 import logging
-from flask import Blueprint, request, jsonify, current_app
+import orjson
+from flask import Blueprint, request, jsonify
+from config import settings
 from services.database_service import insert_new_client
+from services.ingest_queue import enqueue_client
 from utils.validators import validate_phone, validate_email, sanitize_phone, sanitize_email
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
@@ -11,8 +15,35 @@ logger = logging.getLogger(__name__)
 # Cria o Blueprint
 webhooks_bp = Blueprint('webhooks', __name__)
 
-# Token de segurança do .env
-API_SECRET_TOKEN = os.getenv("API_SECRET_TOKEN")
+# Inserção em lote (fila em background). Desative com WEBHOOK_BATCH_MODE=false
+WEBHOOK_BATCH_MODE = os.getenv("WEBHOOK_BATCH_MODE", "true").lower() == "true"
+
+# Campos obrigatórios do payload
+REQUIRED_FIELDS = frozenset(('nome', 'telefone'))
+
+# Token de segurança do .env (obrigatório: config.settings() falha no startup sem ele)
+API_SECRET_TOKEN = settings().api_secret_token
+_TOKEN_BYTES = API_SECRET_TOKEN.encode("utf-8")
+
+
+def _extract_token(headers) -> str:
+    """Extrai o token de "Authorization: Bearer <TOKEN>", token limpo ou X-API-Token."""
+    auth_header = headers.get("Authorization", "")
+    if auth_header.startswith("Bearer "):
+        return auth_header[7:].strip()
+    return (auth_header or headers.get("X-API-Token", "")).strip()
+
+
+@webhooks_bp.before_request
+def authenticate_webhook():
+    """
+    Autenticação do webhook, executada antes de o Flask ler o corpo da requisição.
+    Requisições sem token válido são rejeitadas sem custo de parse do JSON.
+    """
+    # Comparação em tempo constante (evita vazamento do token por timing)
+    provided_token = _extract_token(request.headers)
+    if not hmac.compare_digest(provided_token.encode("utf-8"), _TOKEN_BYTES):
+        return jsonify({"error": "Acesso Negado. Token inválido."}), 403
 
 
 @webhooks_bp.route('/webhook', methods=['POST'])
@@ -20,48 +51,30 @@ def receive_webhook():
     """
     Recebe dados de novos clientes.
     Segurança:
-    1. Verifica Token de Autorização (Header).
+    1. Token de Autorização (Header) verificado em `authenticate_webhook`.
     2. Valida se os dados obrigatórios existem.
     """
 
-    # ============================================================
-    # 1. AUTENTICAÇÃO DO WEBHOOK (CORRIGIDO)
-    # ============================================================
-
-    # Garantir que o token da aplicação existe
-    if not API_SECRET_TOKEN:
-        current_app.logger.error("❌ ERRO CRÍTICO: API_SECRET_TOKEN não definido no ambiente!")
-        return jsonify({"error": "Server misconfigured (missing API_SECRET_TOKEN)"}), 500
-
-    auth_header = request.headers.get("Authorization", "")
-    alt_header = request.headers.get("X-API-Token", "")
-
-    # Suporta "Bearer <TOKEN>" e token limpo
-    provided_token = (
-        auth_header.replace("Bearer ", "").strip()
-        if auth_header else alt_header.strip()
-    )
-
-    if provided_token != API_SECRET_TOKEN:
-        return jsonify({"error": "Acesso Negado. Token inválido."}), 403
+    # 1. AUTENTICAÇÃO: feita em authenticate_webhook (before_request)
 
     # ============================================================
     # 2. CAPTURA O JSON
     # ============================================================
 
-    data = request.get_json()
-    if not data:
+    try:
+        data = orjson.loads(request.get_data(cache=False))
+    except orjson.JSONDecodeError:
+        data = None
+    if not data or not isinstance(data, dict):
         return jsonify({"error": "Payload JSON inválido ou vazio."}), 400
 
     # ============================================================
     # 3. VALIDAÇÃO DE CAMPOS OBRIGATÓRIOS
     # ============================================================
 
-    required_fields = ['nome', 'telefone']
-    for field in required_fields:
-        if field not in data:
-            logger.warning(f"Campo obrigatório ausente: {field}")
-            return jsonify({"error": f"Campo obrigatório ausente: {field}"}), 400
+    missing = REQUIRED_FIELDS - data.keys()
+    if missing:
+        return jsonify({"error": f"Campo obrigatório ausente: {', '.join(sorted(missing))}"}), 400
 
     # ============================================================
     # 4. VALIDAÇÃO E SANITIZAÇÃO
@@ -73,6 +86,8 @@ def receive_webhook():
     status = str(data.get('status') or 'Novo Cliente - 1 compra').strip()
     observacoes = data.get('observacoes', '').strip() if data.get('observacoes') else ''
     dry_run = str(request.headers.get('X-Dry-Run', 'false')).lower() == 'true'
+    # X-Sync: true força a inserção imediata (necessário para receber o client_id)
+    sync = str(request.headers.get('X-Sync', 'false')).lower() == 'true'
 
     # Telefone
     telefone_valido, erro_telefone = validate_phone(telefone)
@@ -100,27 +115,32 @@ def receive_webhook():
     procedimento = data.get('procedimento', '')
     valor_pago = data.get('valor_pago')
 
-    # Data primeira compra
+    # Um único "agora" por requisição
+    now = datetime.now()
+
+    # Data primeira compra (data_compra guarda o valor já convertido, evitando re-parse)
+    data_compra = None
     if data_primeira_compra:
         try:
             if isinstance(data_primeira_compra, str) and '/' in data_primeira_compra:
-                from datetime import datetime as dt
-                data_primeira_compra = dt.strptime(data_primeira_compra, '%d/%m/%Y').date().isoformat()
+                data_compra = datetime.strptime(data_primeira_compra, '%d/%m/%Y')
+                data_primeira_compra = data_compra.date().isoformat()
         except Exception as e:
-            logger.warning(f"Data inválida recebida: {data_primeira_compra} - {e}")
+            logger.warning("Data inválida recebida: %s - %s", data_primeira_compra, e)
             data_primeira_compra = None
     else:
-        data_primeira_compra = datetime.now().date().isoformat()
+        data_compra = datetime.combine(now.date(), datetime.min.time())
+        data_primeira_compra = data_compra.date().isoformat()
 
     # Próxima ação automática (7 dias depois)
     proxima_acao = data.get('proxima_acao')
     if not proxima_acao and data_primeira_compra:
         try:
-            from datetime import timedelta
-            data_compra = datetime.fromisoformat(str(data_primeira_compra))
+            if data_compra is None:
+                data_compra = datetime.fromisoformat(str(data_primeira_compra))
             proxima_acao = (data_compra + timedelta(days=7)).isoformat()
         except Exception as e:
-            logger.warning(f"Erro ao calcular próxima ação: {e}")
+            logger.warning("Erro ao calcular próxima ação: %s", e)
             proxima_acao = None
 
     # --- Aceita campo 'ultima_acao' se enviado ---
@@ -129,12 +149,11 @@ def receive_webhook():
         try:
             # aceita formatos: 'dd/mm/YYYY' ou ISO
             if isinstance(ultima_acao, str) and '/' in ultima_acao:
-                from datetime import datetime as _dt
-                ultima_acao = _dt.strptime(ultima_acao, '%d/%m/%Y').isoformat()
+                ultima_acao = datetime.strptime(ultima_acao, '%d/%m/%Y').isoformat()
             else:
                 ultima_acao = datetime.fromisoformat(str(ultima_acao)).isoformat()
         except Exception as e:
-            logger.warning(f"Formato de ultima_acao inválido: {ultima_acao} - {e}")
+            logger.warning("Formato de ultima_acao inválido: %s - %s", ultima_acao, e)
             ultima_acao = None
 
     # Valor pago
@@ -142,7 +161,7 @@ def receive_webhook():
         try:
             valor_pago = float(str(valor_pago).replace(',', '.'))
         except Exception:
-            logger.warning(f"Valor pago inválido: {valor_pago}")
+            logger.warning("Valor pago inválido: %s", valor_pago)
             valor_pago = None
 
     client_payload = {
@@ -158,7 +177,7 @@ def receive_webhook():
         "observacoes": observacoes
     }
 
-    logger.info(f"Processando novo cliente: {nome} ({telefone_sanitizado})")
+    logger.info("Processando novo cliente: %s (%s)", nome, telefone_sanitizado)
 
     # ============================================================
     # DRY RUN
@@ -170,6 +189,17 @@ def receive_webhook():
             "normalized_payload": client_payload
         }), 200
 
+    # ============================================================
+    # 6. ENFILEIRAMENTO (INSERÇÃO EM LOTE)
+    # ============================================================
+
+    if WEBHOOK_BATCH_MODE and not sync and enqueue_client(client_payload):
+        return jsonify({
+            "message": "Cliente recebido com sucesso!",
+            "queued": True,
+            "nome": nome
+        }), 202
+
     # ============================================================
     # 7. INSERÇÃO NO BANCO
     # ============================================================
@@ -177,10 +207,10 @@ def receive_webhook():
     new_client, error = insert_new_client(client_payload)
 
     if error:
-        logger.error(f"Erro ao salvar cliente: {error}")
+        logger.error("Erro ao salvar cliente: %s", error)
         return jsonify({"error": f"Falha ao salvar no banco: {error}"}), 500
 
-    logger.info(f"Cliente criado com sucesso: ID {new_client.get('id')}")
+    logger.info("Cliente criado com sucesso: ID %s", new_client.get('id'))
 
     return jsonify({
         "message": "Cliente recebido com sucesso!",
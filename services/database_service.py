@@ -1,42 +1,166 @@
 import os
+import time
+import logging
+import random
+import threading
+import httpx
 from supabase import create_client, Client
-from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
-# Carrega variáveis de ambiente para não expor credenciais
-load_dotenv()
+from config import settings
+from utils.http_pool import configure_http_pool
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+# Configuração de logging
+logger = logging.getLogger(__name__)
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("❌ ERRO CRÍTICO: Variáveis do Supabase não configuradas no .env")
+# Credenciais vêm do ambiente (.env), validadas no startup por config.settings()
+SUPABASE_URL = settings().supabase_url
+SUPABASE_KEY = settings().supabase_key
+
+# Limites do pool de conexões HTTP com o PostgREST (keep-alive entre requisições)
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "60"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "40"))
 
 # Inicializa conexão segura
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+configure_http_pool(supabase, SUPABASE_MAX_CONNECTIONS, SUPABASE_MAX_KEEPALIVE)
+
+# Retentativas com backoff exponencial (com jitter) para falhas transitórias de rede
+DB_RETRY_ATTEMPTS = int(os.getenv("DB_RETRY_ATTEMPTS", "4"))
+DB_RETRY_BASE_DELAY = float(os.getenv("DB_RETRY_BASE_DELAY", "0.1"))
+DB_RETRY_MAX_DELAY = float(os.getenv("DB_RETRY_MAX_DELAY", "2"))
+
+# A requisição não chegou ao servidor: sempre seguro repetir
+_RETRY_ALWAYS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# A requisição pode ter sido processada: só repete operações idempotentes
+_RETRY_IDEMPOTENT = _RETRY_ALWAYS + (httpx.ReadTimeout, httpx.ReadError, httpx.RemoteProtocolError)
+
+
+def _execute(query, idempotent: bool = True):
+    """
+    Executa uma query do PostgREST repetindo em falhas transitórias de rede.
+    
+    Args:
+        query: Query montada (ex.: supabase.table('clientes').select('*'))
+        idempotent: False para escritas que não podem ser duplicadas (ex.: insert
+            em acoes) — nesse caso só repete quando a requisição não foi enviada
+    """
+    retry_on = _RETRY_IDEMPOTENT if idempotent else _RETRY_ALWAYS
+    attempt = 1
+    while True:
+        try:
+            return query.execute()
+        except retry_on:
+            if attempt >= DB_RETRY_ATTEMPTS:
+                raise
+            delay = min(DB_RETRY_MAX_DELAY, DB_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+            time.sleep(random.uniform(0, delay))
+            attempt += 1
+
+
+# Cache em memória das listagens de clientes (get_all_clients)
+CLIENTS_CACHE_TTL = float(os.getenv("CLIENTS_CACHE_TTL", "15"))
+_CLIENTS_CACHE_MAXSIZE = 128
+_clients_cache = {}
+_clients_cache_lock = threading.Lock()
+
+
+def invalidate_clients_cache() -> None:
+    """Descarta as listagens de clientes em cache (chamado após escritas)."""
+    with _clients_cache_lock:
+        _clients_cache.clear()
+
+
+# Colunas de clientes aceitas na inserção
+_ALLOWED_CLIENT_FIELDS = frozenset((
+    'nome','telefone','email','status','data_primeira_compra',
+    'procedimento','valor_pago','proxima_acao','observacoes','ultima_acao','cpf'
+))
+
+
+def _filter_client_fields(data: dict) -> dict:
+    """Mantém apenas as colunas permitidas (sem copiar se já estiver limpo)."""
+    if data.keys() <= _ALLOWED_CLIENT_FIELDS:
+        return data
+    return {k: v for k, v in data.items() if k in _ALLOWED_CLIENT_FIELDS}
+
+def _insert_clients_idempotent(payload):
+    """
+    Upsert em clientes ignorando telefones já cadastrados.
+    
+    Sem a constraint uniq_clientes_telefone (ex.: migração pulada por haver
+    duplicatas) o PostgREST responde 42P10 ao on_conflict; nesse caso insere
+    normalmente para não derrubar a ingestão.
+    """
+    try:
+        return _execute(supabase.table('clientes').upsert(
+            payload, on_conflict='telefone', ignore_duplicates=True
+        ))
+    except Exception as e:
+        if getattr(e, 'code', None) != '42P10':
+            raise
+        logger.warning("Constraint uniq_clientes_telefone ausente (%s) — inserindo sem deduplicar por telefone", e)
+        return _execute(supabase.table('clientes').insert(payload), idempotent=False)
+
 
 def insert_new_client(data: dict) -> tuple:
+    """
+    Insere um cliente de forma idempotente por telefone.
+    
+    Reentregas do mesmo webhook não criam linhas duplicadas: se o telefone já
+    existe, nada é alterado e o cliente existente é retornado.
+    
+    Returns:
+        Tuple[dict, Optional[str]]: (cliente, erro)
+    """
     try:
-        allowed = {
-            'nome','telefone','email','status','data_primeira_compra',
-            'procedimento','valor_pago','proxima_acao','observacoes','ultima_acao','cpf'
-        }
-        payload = {k: v for k, v in data.items() if k in allowed}
-        response = supabase.table('clientes').insert(payload).execute()
+        payload = _filter_client_fields(data)
+        response = _insert_clients_idempotent(payload)
         if response.data:
+            invalidate_clients_cache()
             return response.data[0], None
+        # Conflito: o telefone já existe, devolve o registro atual
+        existing = _execute(supabase.table('clientes').select('*').eq('telefone', payload.get('telefone')).limit(1))
+        if existing.data:
+            return existing.data[0], None
         error_msg = getattr(response, 'error', None)
         return None, str(error_msg) if error_msg else "Erro desconhecido ao inserir."
     except Exception as e:
         return None, f"Erro de conexão com DB: {str(e)}"
 
+
+def insert_clients_batch(rows: list) -> tuple:
+    """
+    Insere vários clientes em uma única requisição ao PostgREST.
+    Telefones já cadastrados (ou repetidos no lote) são ignorados.
+    
+    Args:
+        rows: Lista de dicionários com os dados dos clientes (mesmas chaves em todos)
+    
+    Returns:
+        Tuple[list, Optional[str]]: (clientes_inseridos, erro)
+    """
+    try:
+        payload = [_filter_client_fields(row) for row in rows]
+        response = _insert_clients_idempotent(payload)
+        if response.data:
+            invalidate_clients_cache()
+            return response.data, None
+        if getattr(response, 'error', None) is None:
+            # Todos os telefones do lote já existiam
+            return [], None
+        error_msg = getattr(response, 'error', None)
+        return None, str(error_msg) if error_msg else "Erro desconhecido ao inserir lote."
+    except Exception as e:
+        return None, f"Erro de conexão com DB: {str(e)}"
+
 def get_clients_for_automation() -> tuple:
     """
     Busca clientes para o Robô.
     """
     try:
         # Busca todos os campos. Em produção, liste apenas os campos necessários (SELECT nome, telefone...)
-        response = supabase.table('clientes').select('*').execute()
+        response = _execute(supabase.table('clientes').select('*'))
         return response.data, None
     except Exception as e:
         return None, f"Erro ao buscar clientes: {str(e)}"
@@ -54,11 +178,12 @@ def update_client_status(client_id: int, novo_status: str) -> tuple:
         Tuple[dict, Optional[str]]: (dados_atualizados, erro)
     """
     try:
-        response = supabase.table('clientes').update({
+        response = _execute(supabase.table('clientes').update({
             'status': novo_status
-        }).eq('id', client_id).execute()
+        }).eq('id', client_id))
         
         if response.data:
+            invalidate_clients_cache()
             return response.data[0], None
         else:
             return None, "Cliente não encontrado ou nenhuma alteração realizada"
@@ -67,31 +192,78 @@ def update_client_status(client_id: int, novo_status: str) -> tuple:
         return None, f"Erro ao atualizar status: {str(e)}"
 
 
-def get_all_clients() -> tuple:
+def get_all_clients(columns: str = '*', limit: int = None, offset: int = 0, after: tuple = None) -> tuple:
     """
-    Busca todos os clientes do banco de dados.
+    Busca os clientes do banco de dados (mais recentes primeiro).
     Útil para o dashboard e relatórios.
+    O resultado fica em cache por CLIENTS_CACHE_TTL segundos (invalidado nas escritas).
+    
+    Args:
+        columns: Colunas a retornar (formato do PostgREST, ex.: 'id,nome')
+        limit: Opcional - tamanho da página (sem limite se None)
+        offset: Posição inicial da página
+        after: Opcional - (created_at, id) da última linha da página anterior;
+            paginação por keyset, estável mesmo com inserções durante a leitura
     
     Returns:
         Tuple[list, Optional[str]]: (lista_de_clientes, erro)
     """
+    cache_key = (columns, limit, offset, after)
+    with _clients_cache_lock:
+        hit = _clients_cache.get(cache_key)
+    if hit is not None and time.monotonic() - hit[0] < CLIENTS_CACHE_TTL:
+        return hit[1], None
+
     try:
-        response = supabase.table('clientes').select('*').order('created_at', desc=True).execute()
+        # id como desempate: ordem total, necessária para o keyset
+        query = supabase.table('clientes').select(columns).order('created_at', desc=True).order('id', desc=True)
+        if after is not None:
+            created_at, last_id = after
+            query = query.or_(
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{last_id})'
+            )
+            offset = 0
+        if limit is not None:
+            query = query.range(offset, offset + limit - 1)
+        response = _execute(query)
+        with _clients_cache_lock:
+            if len(_clients_cache) >= _CLIENTS_CACHE_MAXSIZE:
+                _clients_cache.clear()
+            _clients_cache[cache_key] = (time.monotonic(), response.data)
         return response.data, None
     except Exception as e:
         return None, f"Erro ao buscar clientes: {str(e)}"
 
 
+def get_client_by_id(client_id: int, columns: str = '*') -> tuple:
+    """
+    Busca um cliente pelo ID.
+    
+    Args:
+        client_id: ID do cliente
+        columns: Colunas a retornar (formato do PostgREST, ex.: 'id,nome')
+    
+    Returns:
+        Tuple[Optional[dict], Optional[str]]: (cliente_ou_None, erro)
+    """
+    try:
+        response = _execute(supabase.table('clientes').select(columns).eq('id', client_id).limit(1))
+        return (response.data[0] if response.data else None), None
+    except Exception as e:
+        return None, f"Erro ao buscar cliente: {str(e)}"
+
+
 # ============================================
 # FUNÇÕES PARA TABELA AÇÕES
 # ============================================
 
-def insert_action(acao_data: dict) -> tuple:
+def insert_action(acao_data) -> tuple:
     """
     Insere uma nova ação na tabela ações.
+    Aceita também uma lista de ações, gravadas em uma única requisição.
     
     Args:
-        acao_data: Dicionário com dados da ação
+        acao_data: Dicionário (ou lista de dicionários) com dados da ação
             - id_cliente: ID do cliente
             - tipo: 'mensagem' ou 'ligacao'
             - conteudo: Conteúdo da mensagem ou notas
@@ -99,10 +271,13 @@ def insert_action(acao_data: dict) -> tuple:
     
     Returns:
         Tuple[dict, Optional[str]]: (acao_criada, erro)
+        Para uma lista: Tuple[list, Optional[str]]: (acoes_criadas, erro)
     """
     try:
-        response = supabase.table('acoes').insert(acao_data).execute()
+        response = _execute(supabase.table('acoes').insert(acao_data), idempotent=False)
         if response.data:
+            if isinstance(acao_data, list):
+                return response.data, None
             return response.data[0], None
         else:
             return None, "Erro desconhecido ao inserir ação"
@@ -110,38 +285,96 @@ def insert_action(acao_data: dict) -> tuple:
         return None, f"Erro ao inserir ação: {str(e)}"
 
 
-def get_actions_by_client(client_id: int) -> tuple:
+# Linhas por INSERT em lote (mantém o corpo da requisição do PostgREST pequeno)
+BATCH_INSERT_CHUNK = int(os.getenv("BATCH_INSERT_CHUNK", "500"))
+
+
+class BatchInserter:
+    """
+    Acumula linhas e grava em lotes: um INSERT a cada `chunk` linhas e o
+    restante ao sair do bloco `with`. As linhas gravadas ficam em `inserted`.
+    
+    Exemplo:
+        with BatchInserter('acoes') as lote:
+            for row in rows:
+                lote.add(row)
+        acoes_criadas = lote.inserted
+    
+    Erros do PostgREST são relançados; o que já foi gravado continua em `inserted`.
+    """
+    
+    def __init__(self, table: str, chunk: int = BATCH_INSERT_CHUNK):
+        self.table = table
+        self.chunk = chunk
+        self.rows = []
+        self.inserted = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+    
+    def add(self, row: dict) -> None:
+        """Adiciona uma linha ao lote (grava se atingir o tamanho do chunk)."""
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk:
+            self.flush()
+    
+    def flush(self) -> None:
+        """Grava as linhas acumuladas em uma única requisição."""
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        # INSERT não é idempotente: só repete se a requisição não chegou ao servidor
+        response = _execute(supabase.table(self.table).insert(rows), idempotent=False)
+        self.inserted.extend(response.data or [])
+        if self.table == 'clientes':
+            invalidate_clients_cache()
+
+
+# Colunas de acoes retornadas nas consultas (created_at/updated_at ficam de fora)
+ACTION_COLUMNS = 'id,id_cliente,tipo,conteudo,resultado,data'
+# Ações pendentes trazem só os dados do cliente necessários para o contato
+PENDING_ACTION_COLUMNS = f'{ACTION_COLUMNS},clientes(id,nome,telefone)'
+
+
+def get_actions_by_client(client_id: int, columns: str = ACTION_COLUMNS) -> tuple:
     """
     Busca todas as ações de um cliente específico.
     
     Args:
         client_id: ID do cliente
+        columns: Colunas a retornar (formato do PostgREST, ex.: 'id,tipo')
     
     Returns:
         Tuple[list, Optional[str]]: (lista_de_acoes, erro)
     """
     try:
-        response = supabase.table('acoes').select('*').eq('id_cliente', client_id).order('data', desc=True).execute()
+        response = _execute(supabase.table('acoes').select(columns).eq('id_cliente', client_id).order('data', desc=True))
         return response.data, None
     except Exception as e:
         return None, f"Erro ao buscar ações: {str(e)}"
 
 
-def get_pending_actions(action_type: str = None) -> tuple:
+def get_pending_actions(action_type: str = None, columns: str = PENDING_ACTION_COLUMNS) -> tuple:
     """
     Busca ações pendentes (resultado = 'pendente').
     
     Args:
         action_type: Opcional - 'mensagem' ou 'ligacao' para filtrar
+        columns: Colunas a retornar, incluindo o embed de clientes
     
     Returns:
         Tuple[list, Optional[str]]: (lista_de_acoes_pendentes, erro)
     """
     try:
-        query = supabase.table('acoes').select('*, clientes(*)').eq('resultado', 'pendente')
+        query = supabase.table('acoes').select(columns).eq('resultado', 'pendente')
         if action_type:
             query = query.eq('tipo', action_type)
-        response = query.order('data', desc=True).execute()
+        response = _execute(query.order('data', desc=True))
         return response.data, None
     except Exception as e:
         return None, f"Erro ao buscar ações pendentes: {str(e)}"
@@ -159,9 +392,9 @@ def update_action_result(action_id: int, resultado: str) -> tuple:
         Tuple[dict, Optional[str]]: (acao_atualizada, erro)
     """
     try:
-        response = supabase.table('acoes').update({
+        response = _execute(supabase.table('acoes').update({
             'resultado': resultado
-        }).eq('id', action_id).execute()
+        }).eq('id', action_id))
         
         if response.data:
             return response.data[0], None
@@ -171,68 +404,65 @@ def update_action_result(action_id: int, resultado: str) -> tuple:
         return None, f"Erro ao atualizar ação: {str(e)}"
 
 
-def get_clients_needing_action(days_after_purchase: int = 7) -> tuple:
+def update_actions_result(action_ids: list, resultado: str) -> tuple:
+    """
+    Atualiza o resultado de várias ações em uma única requisição.
+    
+    Args:
+        action_ids: IDs das ações
+        resultado: 'sim', 'nao', 'sem_resposta', 'agendou', 'comprou'
+    
+    Returns:
+        Tuple[list, Optional[str]]: (acoes_atualizadas, erro)
+    """
+    if not action_ids:
+        return [], None
+    try:
+        response = _execute(supabase.table('acoes').update({
+            'resultado': resultado
+        }).in_('id', action_ids))
+        return response.data, None
+    except Exception as e:
+        return None, f"Erro ao atualizar ações: {str(e)}"
+
+
+def get_clients_needing_action(days_after_purchase: int = 7, columns: str = '*') -> tuple:
     """
     Busca clientes que precisam de ação baseado na data da primeira compra.
     
+    Todo o filtro é feito no Postgres (PostgREST), então só trafegam as linhas
+    que realmente precisam de ação.
+    
     Args:
         days_after_purchase: Número de dias após a compra para disparar ação
+        columns: Colunas retornadas (padrão: todas)
     
     Returns:
         Tuple[list, Optional[str]]: (lista_de_clientes, erro)
     """
     try:
-        from datetime import datetime, timedelta
+        hoje = datetime.now().date()
         # Calcula a data limite (hoje - days_after_purchase)
-        data_limite = (datetime.now() - timedelta(days=days_after_purchase)).date()
+        data_limite = hoje - timedelta(days=days_after_purchase)
+        amanha = hoje + timedelta(days=1)
+        # last_followup_at é TIMESTAMPTZ gravado em UTC: corte no início do dia UTC,
+        # como instante com fuso (aspas: o '+' do offset não vira separador)
+        inicio_dia_utc = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
         
         # Busca clientes que:
-        # 1. Têm data_primeira_compra
-        # 2. A data_primeira_compra + days_after_purchase <= hoje
-        # 3. Não têm próxima_acao agendada OU próxima_acao <= hoje
-        # Seleciona clientes cuja data_primeira_compra <= data_limite (compras antigas)
-        response = supabase.table('clientes').select('*').lte('data_primeira_compra', str(data_limite)).execute()
-        
-        # Filtra clientes que realmente precisam de ação
-        clientes_que_precisam = []
-        hoje = datetime.now().date()
+        # 1. Têm data_primeira_compra <= data_limite (compras antigas)
+        # 2. Não têm próxima_acao agendada OU próxima_acao é até hoje (< amanhã)
+        # 3. Ainda não receberam acompanhamento hoje (last_followup_at)
+        query = (
+            supabase.table('clientes')
+            .select(columns)
+            .lte('data_primeira_compra', data_limite.isoformat())
+            .or_(f'proxima_acao.is.null,proxima_acao.lt.{amanha.isoformat()}')
+            .or_(f'last_followup_at.is.null,last_followup_at.lt."{inicio_dia_utc.isoformat()}"')
+        )
+        response = _execute(query)
         
-        for cliente in response.data:
-            data_compra_str = cliente.get('data_primeira_compra')
-            if not data_compra_str:
-                continue
-                
-            # Converte string para date
-            if isinstance(data_compra_str, str):
-                try:
-                    # tenta ISO first
-                    data_compra = datetime.fromisoformat(data_compra_str.replace('Z', '+00:00')).date()
-                except Exception:
-                    # tenta dd/mm/YYYY
-                    try:
-                        from datetime import datetime as _dt
-                        data_compra = _dt.strptime(data_compra_str, '%d/%m/%Y').date()
-                    except Exception:
-                        continue
-            else:
-                data_compra = data_compra_str
-            
-            # Verifica se já passou o intervalo
-            dias_desde_compra = (hoje - data_compra).days
-            if dias_desde_compra >= days_after_purchase:
-                proxima_acao = cliente.get('proxima_acao')
-                if not proxima_acao:
-                    clientes_que_precisam.append(cliente)
-                else:
-                    try:
-                        pa_date = datetime.fromisoformat(str(proxima_acao).replace('Z', '+00:00')).date()
-                        if pa_date <= hoje:
-                            clientes_que_precisam.append(cliente)
-                    except Exception:
-                        # se não conseguiu parsear, considera que precisa de atenção
-                        clientes_que_precisam.append(cliente)
-        
-        return clientes_que_precisam, None
+        return response.data, None
     except Exception as e:
         return None, f"Erro ao buscar clientes que precisam de ação: {str(e)}"
 
@@ -249,14 +479,50 @@ def update_client_next_action(client_id: int, proxima_acao: str) -> tuple:
         Tuple[dict, Optional[str]]: (cliente_atualizado, erro)
     """
     try:
-        response = supabase.table('clientes').update({
+        response = _execute(supabase.table('clientes').update({
             'proxima_acao': proxima_acao,
             'ultima_acao': datetime.now().isoformat()
-        }).eq('id', client_id).execute()
+        }).eq('id', client_id))
         
         if response.data:
+            invalidate_clients_cache()
             return response.data[0], None
         else:
             return None, "Cliente não encontrado"
     except Exception as e:
         return None, f"Erro ao atualizar próxima ação: {str(e)}"
+
+
+def update_clients_batch(rows: list) -> tuple:
+    """
+    Atualiza vários clientes com UPDATEs em lote.
+    
+    Linhas com os mesmos valores (ex.: mesma proxima_acao) viram um único
+    UPDATE ... WHERE id IN (...). Não usa upsert: o INSERT proposto pelo
+    upsert passaria pelos CHECKs (ex.: chk_proxima_acao com created_at = NOW())
+    e recriaria clientes apagados durante o processamento.
+    
+    Args:
+        rows: Lista de dicionários com 'id' e apenas as colunas que mudam
+    
+    Returns:
+        Tuple[list, Optional[str]]: (clientes_atualizados, erro)
+    """
+    if not rows:
+        return [], None
+    grupos = {}
+    for row in rows:
+        valores = tuple(sorted((k, v) for k, v in row.items() if k != 'id'))
+        grupos.setdefault(valores, []).append(row['id'])
+    atualizados = []
+    erros = []
+    for valores, ids in grupos.items():
+        try:
+            response = _execute(supabase.table('clientes').update(dict(valores)).in_('id', ids))
+            atualizados.extend(response.data or [])
+        except Exception as e:
+            erros.append(f"ids {ids}: {str(e)}")
+    invalidate_clients_cache()
+    if erros:
+        return atualizados, f"Erro ao atualizar clientes: {'; '.join(erros)}"
+    return atualizados, None
@@ -0,0 +1,170 @@
+"""
+Fila de ingestão em lote para os webhooks de novos clientes.
+
+O handler do webhook apenas valida e enfileira o cliente; uma thread em
+background drena a fila a cada ~500 ms (ou ao juntar INGEST_BATCH_SIZE itens)
+e grava tudo com um único INSERT no Supabase, em vez de uma requisição HTTP
+por webhook.
+
+Atenção: itens enfileirados vivem apenas na memória do processo. Na parada
+normal a fila é esvaziada (atexit), mas um crash do processo perde o que ainda
+não foi gravado.
+"""
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from services.database_service import insert_clients_batch, insert_new_client
+
+# Configuração de logging
+logger = logging.getLogger(__name__)
+
+INGEST_QUEUE_MAXSIZE = int(os.getenv("INGEST_QUEUE_MAXSIZE", "10000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", "500"))
+# Lotes gravados em paralelo (próximo do pool keep-alive do Supabase)
+INGEST_DB_WORKERS = int(os.getenv("INGEST_DB_WORKERS", "8"))
+# Espera máxima pela thread de flush na parada do processo
+INGEST_SHUTDOWN_TIMEOUT = float(os.getenv("INGEST_SHUTDOWN_TIMEOUT", "10"))
+
+_queue = queue.Queue(maxsize=INGEST_QUEUE_MAXSIZE)
+# Pool fixo de threads para as gravações; o semáforo limita os lotes em voo,
+# fazendo o loop de flush esperar em vez de acumular lotes na fila do executor
+_executor = ThreadPoolExecutor(max_workers=INGEST_DB_WORKERS, thread_name_prefix="ingest-db")
+_inflight = threading.BoundedSemaphore(INGEST_DB_WORKERS)
+_worker = None
+_worker_lock = threading.Lock()
+# Sinaliza à thread de flush que o processo está parando
+_stop = threading.Event()
+
+
+def enqueue_client(client_payload: dict) -> bool:
+    """
+    Enfileira um cliente para inserção em lote.
+    
+    Returns:
+        bool: False se a fila estiver cheia (o chamador deve inserir direto)
+    """
+    _ensure_worker()
+    try:
+        _queue.put_nowait(client_payload)
+        return True
+    except queue.Full:
+        logger.warning("Fila de ingestão cheia — inserindo cliente diretamente")
+        return False
+
+
+def flush_pending() -> int:
+    """
+    Grava imediatamente tudo o que está na fila.
+    
+    Returns:
+        int: Quantidade de clientes processados
+    """
+    total = 0
+    while True:
+        batch = _drain(max_items=INGEST_BATCH_SIZE, max_wait_ms=0)
+        if not batch:
+            return total
+        _insert_batch(batch)
+        total += len(batch)
+
+
+def _ensure_worker():
+    """Inicia a thread de flush na primeira chamada."""
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_flush_loop, name="ingest-flusher", daemon=True)
+            _worker.start()
+
+
+def _drain(max_items: int, max_wait_ms: int) -> list:
+    """
+    Retira até max_items da fila, esperando no máximo max_wait_ms
+    depois do primeiro item.
+    """
+    batch = []
+    try:
+        if max_wait_ms > 0:
+            # Espera o primeiro item por até max_wait_ms (o loop de flush volta
+            # a checar _stop quando a fila está ociosa)
+            batch.append(_queue.get(timeout=max_wait_ms / 1000))
+        else:
+            batch.append(_queue.get_nowait())
+    except queue.Empty:
+        return batch
+
+    deadline = time.monotonic() + max_wait_ms / 1000
+    while len(batch) < max_items:
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining > 0:
+                batch.append(_queue.get(timeout=remaining))
+            else:
+                batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _insert_batch(batch: list):
+    """Insere um lote; se o lote falhar, tenta cliente a cliente."""
+    inserted, error = insert_clients_batch(batch)
+    if not error:
+        logger.info("Lote de %d cliente(s) gravado", len(inserted))
+        return
+
+    logger.warning("Falha ao gravar lote de %d cliente(s): %s — tentando individualmente", len(batch), error)
+    for client_payload in batch:
+        new_client, error = insert_new_client(client_payload)
+        if error:
+            logger.error("Erro ao salvar cliente %s: %s", client_payload.get('nome'), error)
+
+
+def _on_batch_done(future):
+    """Libera a vaga do lote e registra erros inesperados da gravação."""
+    _inflight.release()
+    error = future.exception()
+    if error is not None:
+        logger.error("Erro inesperado no flush da fila de ingestão: %s", error, exc_info=error)
+
+
+def _flush_loop():
+    """Loop da thread de background: drena a fila e despacha lotes para o pool."""
+    # _stop só é checado entre lotes: um lote já retirado da fila é sempre despachado
+    while not _stop.is_set():
+        batch = _drain(max_items=INGEST_BATCH_SIZE, max_wait_ms=INGEST_FLUSH_INTERVAL_MS)
+        if not batch:
+            continue
+        _inflight.acquire()
+        try:
+            _executor.submit(_insert_batch, batch).add_done_callback(_on_batch_done)
+        except RuntimeError:
+            # Executor já encerrado (parada após o timeout do join): grava aqui mesmo
+            _inflight.release()
+            _insert_batch(batch)
+
+
+def _shutdown():
+    """
+    Na parada do processo: para a thread de flush, grava o que restou na fila
+    e só então encerra o pool, aguardando os lotes em voo.
+    """
+    _stop.set()
+    worker = _worker
+    if worker is not None:
+        worker.join(timeout=INGEST_SHUTDOWN_TIMEOUT)
+        if worker.is_alive():
+            logger.warning("Thread de flush não terminou em %.0fs — seguindo com o encerramento", INGEST_SHUTDOWN_TIMEOUT)
+    flush_pending()
+    _executor.shutdown(wait=True)
+
+
+atexit.register(_shutdown)
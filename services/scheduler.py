@@ -3,19 +3,18 @@ Scheduler para automação de tarefas agendadas.
 Executa rotinas diárias para processar clientes e enviar mensagens de acompanhamento.
 """
 import logging
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor as APSThreadPoolExecutor
 from apscheduler.triggers.cron import CronTrigger
 
 from services.database_service import (
-    get_clients_for_automation, 
-    update_client_status,
+    BatchInserter,
     get_clients_needing_action,
-    insert_action,
-    update_client_next_action
+    update_actions_result,
+    update_clients_batch
 )
-from services.whatsapp_service import send_follow_up_message
-from datetime import datetime, timedelta
+from services.whatsapp_service import send_follow_up_messages
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
@@ -23,11 +22,36 @@ logger = logging.getLogger(__name__)
 # Instância global do scheduler
 scheduler = None
 
+# Colunas usadas pelo job diário (envio da mensagem + cálculo da próxima ação)
+AUTOMATION_COLUMNS = 'id,nome,telefone,data_primeira_compra'
+
+
+def _parse_date(valor):
+    """
+    Converte data_primeira_compra (DATE vindo do PostgREST, 'dd/mm/YYYY' ou
+    date/datetime) em date, escolhendo o formato pelo conteúdo da string.
+    """
+    if not valor:
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    if '/' in valor:
+        return datetime.strptime(valor, '%d/%m/%Y').date()
+    return date.fromisoformat(valor[:10])
+
 
 def init_scheduler(app=None):
     """
     Inicializa o scheduler e agenda as tarefas automáticas.
     
+    Execuções perdidas (app fora do ar às 09:00):
+    - misfire_grace_time=3600: se o app voltar até 1h depois do horário, o job
+      ainda roda; depois disso a execução do dia é descartada.
+    - coalesce=True: várias execuções pendentes viram uma só, evitando disparar
+      o envio em massa duas vezes seguidas após uma queda.
+    
     Args:
         app: Instância do Flask app (opcional, para contexto de aplicação)
     """
@@ -38,7 +62,11 @@ def init_scheduler(app=None):
         return scheduler
     
     # Cria o scheduler em background
-    scheduler = BackgroundScheduler(daemon=True)
+    # O job já paraleliza os envios internamente, então basta 1 thread de execução.
+    scheduler = BackgroundScheduler(
+        daemon=True,
+        executors={'default': APSThreadPoolExecutor(max_workers=1)}
+    )
     
     # Agenda a tarefa diária de automação
     # Executa todos os dias às 09:00 (ajuste conforme necessário)
@@ -48,7 +76,9 @@ def init_scheduler(app=None):
         id='automacao_diaria',
         name='Automação Diária - Envio de Mensagens',
         replace_existing=True,
-        max_instances=1  # Evita execuções simultâneas
+        max_instances=1,  # Evita execuções simultâneas
+        coalesce=True,  # Execuções perdidas viram uma só
+        misfire_grace_time=3600  # Até 1h de atraso ainda conta como a execução do dia
     )
     
     # Inicia o scheduler
@@ -66,7 +96,11 @@ def job_diario_de_automacao():
     Responsabilidades:
     1. Busca clientes que precisam de acompanhamento
     2. Envia mensagens de follow-up via WhatsApp
-    3. Atualiza status dos clientes no banco de dados
+    3. Registra o acompanhamento (last_followup_at) e a próxima ação dos clientes
+    
+    As escritas são feitas em lote: INSERTs de até BATCH_INSERT_CHUNK ações, um
+    UPDATE por resultado e, para os clientes, um UPDATE ... WHERE id IN (...) por
+    grupo de valores iguais (update_clients_batch), em vez de 4 requisições por cliente.
     """
     logger.info("=" * 50)
     logger.info("🚀 Iniciando automação diária de clientes")
@@ -76,7 +110,10 @@ def job_diario_de_automacao():
     try:
         # 1. Busca clientes que precisam de ação (baseado em data_primeira_compra)
         # Padrão: 7 dias após a compra
-        clients, error = get_clients_needing_action(days_after_purchase=7)
+        clients, error = get_clients_needing_action(
+            days_after_purchase=7,
+            columns=AUTOMATION_COLUMNS
+        )
         
         if error:
             logger.error(f"❌ Erro ao buscar clientes: {error}")
@@ -88,65 +125,92 @@ def job_diario_de_automacao():
         
         logger.info(f"📊 Total de clientes que precisam de ação: {len(clients)}")
         
-        # 2. Processa cada cliente
-        sucessos = 0
-        falhas = 0
+        agora = datetime.now()
+        
+        # 2. Cria as ações pendentes em lotes (um INSERT a cada BATCH_INSERT_CHUNK clientes)
+        try:
+            with BatchInserter('acoes') as lote:
+                for client in clients:
+                    lote.add({
+                        'id_cliente': client.get('id'),
+                        'tipo': 'mensagem',
+                        'conteudo': f"Mensagem de acompanhamento automática para {client.get('nome', 'Cliente sem nome')}",
+                        'resultado': 'pendente',
+                        'data': agora.isoformat()
+                    })
+        except Exception as e:
+            # Segue com os lotes já gravados; os demais clientes contam como falha
+            logger.error(f"❌ Erro ao criar ações: {str(e)}")
+        acoes_criadas = lote.inserted
+        if not acoes_criadas:
+            return
+        acao_por_cliente = {acao['id_cliente']: acao['id'] for acao in acoes_criadas}
         
+        # 3. Envia as mensagens de follow-up em paralelo (apenas clientes com ação criada)
+        falhas = 0
+        clients_com_acao = []
         for client in clients:
+            if client.get('id') in acao_por_cliente:
+                clients_com_acao.append(client)
+            else:
+                logger.error(f"❌ Ação não criada para {client.get('nome', 'Cliente sem nome')}")
+                falhas += 1
+        
+        resultados = send_follow_up_messages(clients_com_acao)
+        
+        # 4. Separa os resultados
+        sucessos = 0
+        acoes_sim = []
+        acoes_sem_resposta = []
+        clientes_atualizados = []
+        
+        for client, (sucesso, erro) in zip(clients_com_acao, resultados):
             client_id = client.get('id')
             client_nome = client.get('nome', 'Cliente sem nome')
-            client_status = client.get('status', '')
             data_compra = client.get('data_primeira_compra')
+            acao_id = acao_por_cliente[client_id]
             
             logger.info(f"\n📧 Processando cliente: {client_nome} (ID: {client_id})")
             
-            # 3. Cria registro de ação pendente
-            acao_data = {
-                'id_cliente': client_id,
-                'tipo': 'mensagem',
-                'conteudo': f'Mensagem de acompanhamento automática para {client_nome}',
-                'resultado': 'pendente',
-                'data': datetime.now().isoformat()
-            }
-            
-            acao_criada, erro_acao = insert_action(acao_data)
-            if not acao_criada:
-                logger.error(f"❌ Erro ao criar ação para {client_nome}: {erro_acao}")
-                falhas += 1
-                continue
-            
-            # 4. Envia mensagem de follow-up
-            sucesso, erro = send_follow_up_message(client)
-            
             if sucesso:
                 sucessos += 1
-                # 5. Atualiza a ação como concluída
-                update_action_result(acao_criada['id'], 'sim')
+                acoes_sim.append(acao_id)
                 
-                # 6. Atualiza status do cliente e próxima ação
-                novo_status = f"{client_status} | Acompanhamento enviado em {datetime.now().strftime('%d/%m/%Y')}"
-                update_client_status(client_id, novo_status)
+                # Só as colunas que mudam (update_clients_batch agrupa por valores)
+                atualizacao = {
+                    'id': client_id,
+                    'ultima_acao': agora.isoformat(),
+                    # TIMESTAMPTZ: instante com fuso (UTC), independente do fuso do host
+                    'last_followup_at': datetime.now(timezone.utc).isoformat()
+                }
+                # Agenda próxima ação (14 dias após a compra); mantém a atual se não der para calcular
+                try:
+                    data_compra_obj = _parse_date(data_compra)
+                    if data_compra_obj:
+                        atualizacao['proxima_acao'] = (data_compra_obj + timedelta(days=14)).isoformat()
+                except ValueError as e:
+                    logger.warning(f"⚠️ Erro ao calcular próxima ação: {e}")
                 
-                # Agenda próxima ação (14 dias após a compra)
-                if data_compra:
-                    try:
-                        if isinstance(data_compra, str):
-                            data_compra_obj = datetime.fromisoformat(data_compra.replace('Z', '+00:00'))
-                        else:
-                            data_compra_obj = data_compra
-                        proxima_acao = (data_compra_obj + timedelta(days=14)).isoformat()
-                        update_client_next_action(client_id, proxima_acao)
-                    except Exception as e:
-                        logger.warning(f"⚠️ Erro ao calcular próxima ação: {e}")
+                clientes_atualizados.append(atualizacao)
                 
                 logger.info(f"✅ Cliente {client_nome} processado com sucesso")
             else:
                 falhas += 1
-                # Marca ação como falha
-                update_action_result(acao_criada['id'], 'sem_resposta')
+                acoes_sem_resposta.append(acao_id)
                 logger.error(f"❌ Falha ao enviar mensagem para {client_nome}: {erro}")
         
-        # 7. Resumo final
+        # 5. Grava os resultados das ações e os clientes em lote
+        _, erro_update = update_actions_result(acoes_sim, 'sim')
+        if erro_update:
+            logger.error(f"❌ Erro ao marcar ações como concluídas: {erro_update}")
+        _, erro_update = update_actions_result(acoes_sem_resposta, 'sem_resposta')
+        if erro_update:
+            logger.error(f"❌ Erro ao marcar ações sem resposta: {erro_update}")
+        _, erro_update = update_clients_batch(clientes_atualizados)
+        if erro_update:
+            logger.error(f"❌ Erro ao atualizar clientes: {erro_update}")
+        
+        # 6. Resumo final
         logger.info("\n" + "=" * 50)
         logger.info("📈 RESUMO DA AUTOMAÇÃO DIÁRIA")
         logger.info(f"✅ Sucessos: {sucessos}")
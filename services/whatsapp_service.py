@@ -4,9 +4,14 @@ Atualmente implementado como MOCK para desenvolvimento.
 Quando a API real estiver disponível, substitua as funções mock pelas chamadas reais.
 """
 import os
-import requests
+import re
+import time
+import random
+import atexit
+import httpx
 import logging
-from typing import Dict, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Optional
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
@@ -18,6 +23,38 @@ WHATSAPP_PHONE_ID = os.getenv("WHATSAPP_PHONE_ID", "")
 
 # Modo MOCK (True = usa mock, False = usa API real)
 MOCK_MODE = os.getenv("WHATSAPP_MOCK_MODE", "true").lower() == "true"
+# Latência simulada por envio no modo MOCK (segundos). Use 0 em testes de carga
+MOCK_SEND_DELAY = float(os.getenv("WHATSAPP_MOCK_DELAY", "0.1"))
+
+# Regex pré-compilada para limpar telefones (mesmo padrão de utils/validators.py)
+_NON_DIGITS_RE = re.compile(r'\D')
+
+# Envios simultâneos no job diário (limita a pressão sobre a API de WhatsApp)
+WHATSAPP_SEND_CONCURRENCY = int(os.getenv("WHATSAPP_SEND_CONCURRENCY", "20"))
+
+# Cliente HTTP compartilhado: reaproveita conexões (keep-alive/HTTP2) entre os
+# envios, evitando um handshake TLS por mensagem
+# (o transport repete sozinho falhas de conexão, antes de a requisição ser enviada)
+_http_client = httpx.Client(
+    transport=httpx.HTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        retries=3
+    ),
+    timeout=10
+)
+atexit.register(_http_client.close)
+
+# Retentativas com backoff exponencial (com jitter) para falhas transitórias da API
+WHATSAPP_RETRY_ATTEMPTS = int(os.getenv("WHATSAPP_RETRY_ATTEMPTS", "3"))
+WHATSAPP_RETRY_BASE_DELAY = float(os.getenv("WHATSAPP_RETRY_BASE_DELAY", "0.2"))
+WHATSAPP_RETRY_MAX_DELAY = float(os.getenv("WHATSAPP_RETRY_MAX_DELAY", "5"))
+
+# Status em que a mensagem não foi processada e é seguro reenviar.
+# 504 e timeouts de leitura ficam de fora: a API pode ter enviado a mensagem
+# e repetir duplicaria o WhatsApp para o cliente. 4xx de autenticação também.
+_RETRY_STATUS = frozenset((429, 502, 503))
+_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
 
 
 def send_follow_up_message(client_data: Dict) -> Tuple[bool, Optional[str]]:
@@ -40,7 +77,7 @@ def send_follow_up_message(client_data: Dict) -> Tuple[bool, Optional[str]]:
             return False, "Telefone não fornecido"
         
         # Limpa o telefone (remove caracteres não numéricos)
-        telefone_limpo = ''.join(filter(str.isdigit, telefone))
+        telefone_limpo = _only_digits(telefone)
         
         if MOCK_MODE:
             # MODO MOCK - Simula envio de mensagem
@@ -55,6 +92,28 @@ def send_follow_up_message(client_data: Dict) -> Tuple[bool, Optional[str]]:
         return False, f"Erro inesperado: {str(e)}"
 
 
+def send_follow_up_messages(clients: List[Dict]) -> List[Tuple[bool, Optional[str]]]:
+    """
+    Envia a mensagem de acompanhamento para vários clientes em paralelo.
+    
+    Os envios são limitados a WHATSAPP_SEND_CONCURRENCY simultâneos, então o
+    tempo total passa de N x latência para aproximadamente N / concorrência.
+    
+    Args:
+        clients: Lista de dicionários com dados dos clientes
+    
+    Returns:
+        List[Tuple[bool, Optional[str]]]: (sucesso, mensagem_de_erro) de cada
+        cliente, na mesma ordem da lista recebida
+    """
+    if not clients:
+        return []
+    
+    workers = max(1, min(WHATSAPP_SEND_CONCURRENCY, len(clients)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="whatsapp-send") as executor:
+        return list(executor.map(send_follow_up_message, clients))
+
+
 def _mock_send_message(nome: str, telefone: str) -> Tuple[bool, Optional[str]]:
     """
     Simula o envio de mensagem (MOCK).
@@ -62,12 +121,11 @@ def _mock_send_message(nome: str, telefone: str) -> Tuple[bool, Optional[str]]:
     """
     mensagem = f"Olá {nome}! 👋\n\nObrigado por se tornar nosso cliente. Estamos aqui para ajudar!"
     
-    # Simula delay de API
-    import time
-    time.sleep(0.1)
+    # Simula delay de API (em paralelo entre os envios de send_follow_up_messages)
+    if MOCK_SEND_DELAY > 0:
+        time.sleep(MOCK_SEND_DELAY)
     
     # Simula sucesso (90% das vezes) para testes realistas
-    import random
     if random.random() < 0.9:
         logger.info(f"✅ [MOCK] Mensagem enviada com sucesso para {telefone}")
         return True, None
@@ -114,12 +172,7 @@ def _real_send_message(nome: str, telefone: str, client_data: Dict) -> Tuple[boo
         }
         
         # Faz a requisição para a API
-        response = requests.post(
-            f"{WHATSAPP_API_URL}/messages",
-            json=payload,
-            headers=headers,
-            timeout=10
-        )
+        response = _post_with_retry(f"{WHATSAPP_API_URL}/messages", payload, headers)
         
         if response.status_code == 200 or response.status_code == 201:
             logger.info(f"✅ Mensagem enviada com sucesso para {telefone_formatado}")
@@ -129,10 +182,10 @@ def _real_send_message(nome: str, telefone: str, client_data: Dict) -> Tuple[boo
             logger.error(f"❌ Erro ao enviar mensagem: {error_msg}")
             return False, error_msg
             
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         logger.error("Timeout ao conectar com API de WhatsApp")
         return False, "Timeout na conexão com API"
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Erro na requisição para API: {str(e)}")
         return False, f"Erro na requisição: {str(e)}"
     except Exception as e:
@@ -140,13 +193,45 @@ def _real_send_message(nome: str, telefone: str, client_data: Dict) -> Tuple[boo
         return False, f"Erro inesperado: {str(e)}"
 
 
+def _post_with_retry(url: str, payload: Dict, headers: Dict) -> httpx.Response:
+    """
+    Faz o POST na API repetindo apenas falhas transitórias (429/502/503 e erros
+    de conexão), com backoff exponencial e jitter.
+    Retorna a última resposta obtida; relança o erro de rede na última tentativa.
+    """
+    attempt = 1
+    while True:
+        try:
+            response = _http_client.post(url, json=payload, headers=headers)
+            if response.status_code not in _RETRY_STATUS or attempt >= WHATSAPP_RETRY_ATTEMPTS:
+                return response
+            logger.warning(f"API de WhatsApp retornou {response.status_code}, tentativa {attempt}/{WHATSAPP_RETRY_ATTEMPTS}")
+        except _RETRY_ERRORS:
+            if attempt >= WHATSAPP_RETRY_ATTEMPTS:
+                raise
+        delay = min(WHATSAPP_RETRY_MAX_DELAY, WHATSAPP_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        time.sleep(random.uniform(0, delay))
+        attempt += 1
+
+
+def _only_digits(telefone: str) -> str:
+    """
+    Mantém apenas os dígitos do telefone.
+    Telefones gravados pelo webhook já estão sanitizados, então o caso comum
+    retorna a própria string sem percorrer caractere a caractere em Python.
+    """
+    if telefone.isdigit():
+        return telefone
+    return _NON_DIGITS_RE.sub('', telefone)
+
+
 def _format_phone_number(telefone: str) -> str:
     """
     Formata telefone para formato internacional.
     Exemplo: 11987654321 -> 5511987654321
     """
-    # Remove caracteres não numéricos
-    telefone_limpo = ''.join(filter(str.isdigit, telefone))
+    # Remove caracteres não numéricos (no-op se já vier limpo de send_follow_up_message)
+    telefone_limpo = _only_digits(telefone)
     
     # Se não começar com código do país, adiciona (Brasil = 55)
     if not telefone_limpo.startswith('55') and len(telefone_limpo) >= 10:
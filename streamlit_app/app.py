@@ -1,11 +1,26 @@
 import streamlit as st
 import pandas as pd
-from supabase import create_client, Client
+import numpy as np
 import requests
-import json
+import orjson
 import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timezone
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError, RequestException
+from urllib3.util.retry import Retry
+from utils.validators import sanitize_cpf, validate_cpf
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
 
 # --- CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(
@@ -15,77 +30,270 @@ st.set_page_config(
 )
 
 # --- CONEXÃO COM SUPABASE ---
+@lru_cache(maxsize=1)
+def load_env():
+    """Carrega o .env uma única vez por processo (fallback quando não há st.secrets)."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+@lru_cache(maxsize=32)
+def get_cfg(key, default=None):
+    """Configuração por chave: st.secrets primeiro, depois ambiente/.env (lida uma vez por processo)."""
+    try:
+        if key in st.secrets:
+            return st.secrets[key]
+    except Exception:
+        # Sem secrets.toml: segue para as variáveis de ambiente
+        pass
+    load_env()
+    return os.getenv(key, default)
+
 @st.cache_resource
 def init_supabase():
     try:
-        if "SUPABASE_URL" in st.secrets:
-            url = st.secrets["SUPABASE_URL"]
-            key = st.secrets["SUPABASE_KEY"]
-        else:
-            from dotenv import load_dotenv
-            load_dotenv()
-            url = os.getenv("SUPABASE_URL")
-            key = os.getenv("SUPABASE_KEY")
+        url = get_cfg("SUPABASE_URL")
+        key = get_cfg("SUPABASE_KEY")
         if not url or not key:
             st.error("❌ Erro: Variáveis do Supabase não encontradas.")
             return None
-        return create_client(url, key)
+        # Import tardio: sem credenciais o painel não paga o import do supabase-py
+        from supabase import create_client
+        client = create_client(url, key)
+        # Mesmo pool keep-alive da API: um handshake TLS por sessão do painel, não por query
+        from utils.http_pool import configure_http_pool
+        configure_http_pool(client, max_connections=20, max_keepalive=10)
+        return client
     except Exception as e:
         st.error(f"Erro de conexão: {e}")
         return None
 
 supabase = init_supabase()
 
+# Sessão HTTP reaproveitada entre envios ao backend (evita novo handshake TLS a cada submit).
+# Repete falhas de conexão e 502/503 (requisição não chegou ao app) com backoff;
+# 504 e timeouts de leitura não, pois o cliente pode já ter sido gravado.
+HTTP_RETRY = Retry(total=3, connect=3, read=0, status=3, backoff_factor=0.3,
+                   status_forcelist=(502, 503), allowed_methods=frozenset({"GET", "POST"}),
+                   raise_on_status=False)
+
+@st.cache_resource
+def http_session():
+    session = requests.Session()
+    # pool_maxsize cobre os envios paralelos do reenvio do outbox
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=HTTP_RETRY)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Endereço e token do backend, lidos uma vez (st.secrets ou variáveis de ambiente)
+def api_settings():
+    return get_cfg("API_BASE_URL"), get_cfg("API_SECRET_TOKEN")
+
 # --- CONFIGURAÇÕES LOCAIS ---
 OUTBOX_PATH = os.path.join(os.getcwd(), "streamlit_pending_webhooks.jsonl")
+# Envios simultâneos ao backend no reenvio do outbox
+OUTBOX_SEND_CONCURRENCY = 8
 
 # --- FUNÇÕES AUXILIARES DE FORMATAÇÃO ---
-def pretty_datetime(val):
-    if not val:
-        return ""
-    try:
-        dt = pd.to_datetime(val)
-        return dt.tz_convert(None).strftime("%Y-%m-%d %H:%M")
-    except Exception:
-        return str(val)
+# O PostgREST devolve datas em ISO 8601 ("2024-05-01" para DATE,
+# "2024-05-01T12:00:00+00:00" para TIMESTAMPTZ): o formato é fixo, sem inferência
+def parse_datetime(series):
+    """Converte uma coluna de datas (ISO, com ou sem offset) para datetime UTC; inválidas viram NaT."""
+    return pd.to_datetime(series, format="ISO8601", errors="coerce", utc=True, cache=True)
 
+def pretty_datetime(series, fmt="%Y-%m-%d %H:%M", parsed=None):
+    """Formata uma coluna de datas de uma vez (valores não reconhecidos ficam como texto).
+    `parsed`: resultado de parse_datetime(series), para não converter a coluna de novo."""
+    dt = (parsed if parsed is not None else parse_datetime(series)).dt.tz_convert(None)
+    return dt.dt.strftime(fmt).where(dt.notna(), series.fillna("").astype(str))
 
-def mask_cpf(cpf: str) -> str:
-    if not cpf:
-        return ""
-    s = ''.join([c for c in str(cpf) if c.isdigit()])
-    if len(s) != 11:
-        return s
-    return f"{s[0:3]}.{s[3:6]}.{s[6:9]}-{s[9:11]}"
 
-def days_since(val):
-    if not val:
-        return None
-    try:
-        dt = pd.to_datetime(val).date()
-        return (datetime.now().date() - dt).days
-    except Exception:
-        return None
+# Padrões da máscara de CPF compilados uma única vez
+_CPF_NON_DIGITS_RE = re.compile(r"\D")
+_CPF_GROUPS_RE = re.compile(r"^(\d{3})(\d{3})(\d{3})(\d{2})$")
+
+def mask_cpf(series):
+    """Formata a coluna de CPFs como 000.000.000-00 (só dígitos se não tiver 11)."""
+    digits = series.fillna("").astype(str).str.replace(_CPF_NON_DIGITS_RE, "", regex=True)
+    return digits.str.replace(_CPF_GROUPS_RE, r"\1.\2.\3-\4", regex=True)
+
+def days_since(series, parsed=None, today=None):
+    """Dias corridos desde cada data da coluna (vazio se a data for inválida).
+    `today`: dia de referência (naive, UTC), para usar o mesmo "agora" do chamador."""
+    dt = (parsed if parsed is not None else parse_datetime(series)).dt.tz_convert(None)
+    if today is None:
+        today = pd.Timestamp.now(tz="UTC").tz_localize(None).normalize()
+    return (today - dt.dt.normalize()).dt.days.astype("Int64")
 
-def get_table(table_name, limit=1000):
+# Cache das leituras: cada interação no Streamlit re-executa o script inteiro,
+# então sem cache toda clique faria um SELECT no Supabase.
+# Só recebe argumentos simples (o client do Supabase não é "hashable").
+TABLE_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "60"))
+# Limita as combinações (tabela, limite, colunas) guardadas em memória
+TABLE_CACHE_MAX_ENTRIES = 32
+
+# Colunas de baixa cardinalidade guardadas como "category" (um código por linha)
+# e valores monetários em float32 (suficiente para NUMERIC(10,2) na exibição)
+TABLE_DTYPES = {
+    "clientes": {"status": "category", "procedimento": "category", "valor_pago": "float32"},
+    "vw_acoes_pendentes": {"tipo": "category", "tipo_descricao": "category"},
+    "vw_auditoria_recente": {"tabela_afetada": "category", "operacao": "category", "usuario": "category"},
+}
+
+def to_dataframe(table_name, data, columns="*"):
+    """Monta o DataFrame da tabela com tipos compactos (category, inteiros reduzidos e texto Arrow).
+    Com colunas explícitas, a ordem e o esquema são fixos (mesmo sem linhas)."""
+    cols = [c.strip() for c in columns.split(",")] if columns != "*" and "(" not in columns else None
+    df = pd.DataFrame.from_records(data, columns=cols)
+    dtypes = {c: t for c, t in TABLE_DTYPES.get(table_name, {}).items() if c in df.columns}
+    if dtypes:
+        df = df.astype(dtypes)
+    for c in df.select_dtypes("int64").columns:
+        df[c] = pd.to_numeric(df[c], downcast="integer")
+    # Texto em formato Arrow: o st.dataframe envia a coluna ao navegador sem
+    # reconverter string por string a cada rerun
+    for c in df.select_dtypes("object").columns:
+        if pd.api.types.infer_dtype(df[c], skipna=True) == "string":
+            df[c] = df[c].astype("string[pyarrow]")
+    return df
+
+@st.cache_data(ttl=TABLE_CACHE_TTL, max_entries=TABLE_CACHE_MAX_ENTRIES, show_spinner=False)
+def fetch_table(table_name, limit=1000, columns="*", order=None):
+    query = supabase.table(table_name).select(columns)
+    if order:
+        # ORDER BY + LIMIT no Postgres: traz as N primeiras linhas pelo índice
+        query = query.order(order[0], desc=order[1])
+    resp = query.limit(limit).execute()
+    data = getattr(resp, "data", None) or []
+    return to_dataframe(table_name, data, columns)
+
+def get_table(table_name, limit=1000, columns="*", order=None):
+    """order: (coluna, desc) opcional, aplicado no servidor antes do limit."""
     if not supabase:
         return pd.DataFrame()
     try:
-        resp = supabase.table(table_name).select("*").limit(limit).execute()
-        data = getattr(resp, "data", None) or []
-        return pd.DataFrame(data)
+        # Erros não são cacheados (a exceção sai antes de gravar no cache)
+        return fetch_table(table_name, limit, columns, order)
     except Exception as e:
         st.error(f"Erro ao buscar dados de {table_name}: {e}")
         return pd.DataFrame()
 
+# Busca por CPF do formulário: só as colunas usadas no preenchimento.
+# Consultas repetidas (operador corrigindo e buscando de novo) ficam em cache.
+CPF_LOOKUP_COLUMNS = "id,nome,telefone,email,cpf,observacoes"
+# Campos do formulário preenchidos pela busca por CPF (chave do widget -> coluna)
+FORM_PREFILL_FIELDS = {"form_nome": "nome", "form_telefone": "telefone",
+                       "form_email": "email", "form_observacoes": "observacoes"}
+
+@st.cache_data(ttl=30, show_spinner=False)
+def find_client_by_cpf(cpf_digits):
+    """Cliente com o CPF informado (dict) ou None. Usa o índice único de clientes.cpf."""
+    resp = supabase.table("clientes").select(CPF_LOOKUP_COLUMNS).eq("cpf", cpf_digits).limit(1).execute()
+    data = getattr(resp, "data", None) or []
+    return data[0] if data else None
+
+# Paginação da Visão Geral por chave (id > último id da página anterior):
+# custo constante por página, sem o OFFSET que o Postgres percorre linha a linha
+CLIENTES_PAGE_SIZES = [25, 50, 100]
+
+@st.cache_data(ttl=TABLE_CACHE_TTL, max_entries=TABLE_CACHE_MAX_ENTRIES, show_spinner=False)
+def fetch_clientes_page(after_id, page_size, columns):
+    query = supabase.table("clientes").select(columns).order("id")
+    if after_id is not None:
+        query = query.gt("id", after_id)
+    resp = query.limit(page_size).execute()
+    return to_dataframe("clientes", getattr(resp, "data", None) or [], columns)
+
+@st.cache_data(ttl=TABLE_CACHE_TTL, show_spinner=False)
+def fetch_clientes_metricas():
+    """Métricas da tabela inteira calculadas pelo Postgres (COUNT), independentes da página."""
+    agora = datetime.now(timezone.utc).isoformat()
+    def _count(query):
+        return query.limit(1).execute().count or 0
+    def _base():
+        return supabase.table("clientes").select("id", count="exact")
+    return {
+        "total": _count(_base()),
+        "hoje_atrasado": _count(_base().lte("proxima_acao", agora)),
+        "sem_agenda": _count(_base().is_("proxima_acao", "null")),
+    }
+
+# Colunas derivadas da Visão Geral (por página)
+def prepare_clientes_overview(df):
+    # Um único "agora" (UTC) para todas as colunas derivadas
+    agora = pd.Timestamp.now(tz="UTC")
+    # Cada coluna de data é convertida uma única vez e reaproveitada abaixo
+    parsed = {col: parse_datetime(df[col])
+              for col in ("data_primeira_compra", "proxima_acao", "ultima_acao", "last_followup_at")
+              if col in df.columns}
+    # data_primeira_compra é DATE: exibe só a data
+    for col, fmt in [("data_primeira_compra", "%Y-%m-%d"), ("proxima_acao", "%Y-%m-%d %H:%M"),
+                     ("ultima_acao", "%Y-%m-%d %H:%M"), ("last_followup_at", "%Y-%m-%d %H:%M")]:
+        if col in parsed:
+            df[col + "_pretty"] = pretty_datetime(df[col], fmt, parsed=parsed[col])
+    if "data_primeira_compra" in parsed:
+        df["dias_desde_compra"] = days_since(df["data_primeira_compra"], parsed=parsed["data_primeira_compra"],
+                                             today=agora.tz_localize(None).normalize())
+    # format cpf for display (masked)
+    if 'cpf' in df.columns:
+        df['cpf_pretty'] = mask_cpf(df['cpf'])
+    # Situação da próxima ação, calculada na coluna inteira (sem apply por linha).
+    # Comparação em UTC: proxima_acao é TIMESTAMPTZ e vem com offset do PostgREST
+    if "proxima_acao" in parsed:
+        raw = df["proxima_acao"]
+        pa = parsed["proxima_acao"]
+        df["status_acao"] = np.select(
+            [raw.fillna("") == "", pa.isna(), pa <= agora],
+            ["Sem agenda", "Desconhecido", "Hoje / Atrasado"],
+            default="Agendado"
+        )
+    else:
+        df["status_acao"] = "Sem agenda"
+
+    # Colunas derivadas em Arrow, como as demais (to_dataframe): o st.dataframe
+    # serializa para Arrow sem converter objeto Python por objeto
+    derivadas = [c for c in df.columns if c.endswith("_pretty") or c == "status_acao"]
+    if derivadas:
+        df[derivadas] = df[derivadas].astype("string[pyarrow]")
+    return df
+
+# Página da Visão Geral já com as colunas derivadas, em cache pela chave da
+# página (after_id, page_size): reruns não refazem o processamento nem pagam
+# o hash do DataFrame que o st.cache_data faria com um argumento DataFrame
+@st.cache_data(ttl=TABLE_CACHE_TTL, max_entries=TABLE_CACHE_MAX_ENTRIES, show_spinner=False)
+def fetch_clientes_overview(after_id, page_size, columns):
+    df = fetch_clientes_page(after_id, page_size, columns)
+    return prepare_clientes_overview(df) if not df.empty else df
+
+# Colunas exibidas em cada aba (evita trafegar colunas que o painel não mostra)
+CLIENTES_COLUMNS = ("id,nome,cpf,telefone,status,data_primeira_compra,"
+                    "proxima_acao,ultima_acao,last_followup_at,observacoes")
+ACOES_PENDENTES_COLUMNS = "id,cliente_nome,cliente_telefone,tipo,conteudo,data,tipo_descricao"
+AUDITORIA_COLUMNS = "data_operacao,tabela_afetada,operacao,id_registro,usuario,dados_novos"
+
+# Larguras fixas na Visão Geral (evita o cálculo automático de largura a cada render)
+CLIENTES_COLUMN_CONFIG = {
+    "id": st.column_config.NumberColumn("id", width="small"),
+    "nome": st.column_config.TextColumn("nome", width="medium"),
+    "cpf": st.column_config.TextColumn("cpf", width="small"),
+    "telefone": st.column_config.TextColumn("telefone", width="small"),
+    "status": st.column_config.TextColumn("status", width="medium"),
+    "dias_desde_compra": st.column_config.NumberColumn("dias_desde_compra", width="small"),
+    "status_acao": st.column_config.TextColumn("status_acao", width="small"),
+    "observacoes": st.column_config.TextColumn("observacoes", width="large"),
+}
+
+
 # --- OUTBOX E FALLBACK ---
 def save_outbox(record_payload, meta=None):
     entry = {"ts": datetime.now().isoformat(), "payload": record_payload}
     if meta:
         entry["meta"] = meta
     try:
-        with open(OUTBOX_PATH, "a", encoding="utf-8") as f:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        # orjson gera bytes UTF-8 direto: arquivo em modo binário, sem encode.
+        # Sob a trava de escrita: o reenvio em segundo plano não troca o arquivo no meio
+        with outbox_write_lock(), open(OUTBOX_PATH, "ab") as f:
+            f.write(orjson.dumps(entry) + b"\n")
         return True
     except Exception:
         return False
@@ -138,60 +346,169 @@ def try_insert_action_supabase(action_payload):
     except Exception as e:
         return False, f"supabase_exception:{e}", None
 
-def resend_outbox_once(api_base=None, token=None):
-    if not os.path.exists(OUTBOX_PATH):
-        return {"processed": 0, "left": 0}
-    retained = []
-    processed = 0
+def try_register_actions_supabase(client_id, acao=None, compra=None, atualizacao=None):
+    """
+    Ações do formulário em uma única chamada (RPC registrar_acoes_cliente, ver schema.sql).
+    Retorna (success, info, result_or_none)
+    """
+    if not supabase:
+        return False, "no_supabase_client", None
     try:
-        with open(OUTBOX_PATH, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-    except Exception:
-        return {"processed": 0, "left": 0}
-    for ln in lines:
+        resp = supabase.rpc("registrar_acoes_cliente", {
+            "p_id_cliente": client_id,
+            "p_acao": acao,
+            "p_compra": compra,
+            "p_atualizacao": atualizacao,
+        }).execute()
+        data = getattr(resp, "data", None)
+        if isinstance(data, dict):
+            return True, "saved_rpc", data
+        return False, "rpc_unknown", None
+    except Exception as e:
+        return False, f"rpc_exception:{e}", None
+
+def try_save_batch_to_supabase(payloads):
+    """
+    Insere vários clientes de uma vez (um INSERT por conjunto de colunas).
+    Retorna os índices dos payloads que não foram salvos.
+    """
+    if not payloads:
+        return []
+    if not supabase:
+        return list(range(len(payloads)))
+    # O PostgREST exige as mesmas chaves em todas as linhas de um insert em lote
+    grupos = {}
+    for i, payload in enumerate(payloads):
+        grupos.setdefault(frozenset(payload), []).append(i)
+    failed = []
+    for indices in grupos.values():
         try:
-            rec = json.loads(ln)
-            payload = rec.get("payload", {})
+            resp = supabase.table("clientes").insert([payloads[i] for i in indices]).execute()
+            if getattr(resp, "data", None):
+                continue
         except Exception:
-            continue
-        sent = False
-        # try backend if provided
-        if api_base:
+            pass
+        # Lote rejeitado (é atômico): tenta um a um para isolar o registro com problema
+        failed.extend(i for i in indices if not try_save_to_supabase(payloads[i])[0])
+    return sorted(failed)
+
+@contextmanager
+def _flock(path, blocking):
+    """Trava exclusiva via flock no arquivo `path`; devolve False se ocupada (não bloqueante)."""
+    if fcntl is None:
+        yield True
+        return
+    with open(path, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def outbox_lock():
+    """
+    Trava exclusiva (não bloqueante) do outbox entre sessões/processos.
+    Retorna False se outro reenvio já estiver em andamento.
+    """
+    return _flock(OUTBOX_PATH + ".lock", blocking=False)
+
+def outbox_write_lock():
+    """
+    Trava curta (bloqueante) de escrita do arquivo: serializa os appends de
+    save_outbox com a leitura/troca do arquivo feita pelos reenvios.
+    """
+    return _flock(OUTBOX_PATH + ".write.lock", blocking=True)
+
+def resend_outbox_once(api_base=None, token=None):
+    # Evita que duas sessões reenviem (e dupliquem) os mesmos registros.
+    # Sem os.path.exists antes: outbox ausente é tratado na própria leitura (EAFP)
+    with outbox_lock() as locked:
+        if not locked:
+            return {"processed": 0, "left": 0, "busy": True}
+        return _resend_outbox(api_base, token)
+
+def iter_outbox():
+    """Percorre o outbox linha a linha (sem carregar o arquivo inteiro em memória)."""
+    with open(OUTBOX_PATH, "rb") as f:
+        for ln in f:
             try:
-                headers = {"Content-Type": "application/json"}
-                if token:
-                    headers["Authorization"] = f"Bearer {token}"
-                r = requests.post(api_base.rstrip("/") + "/api/webhook", json=payload, headers=headers, timeout=8)
-                if r.status_code in (200, 201):
-                    processed += 1
-                    sent = True
-                else:
-                    # not successful -> try supabase
-                    saved, info = try_save_to_supabase(payload)
-                    if saved:
-                        processed += 1
-                        sent = True
+                rec = orjson.loads(ln)
             except Exception:
-                pass
-        if not sent:
-            # try direct supabase
-            saved, info = try_save_to_supabase(payload)
-            if saved:
-                processed += 1
-                sent = True
-        if not sent:
-            retained.append(rec)
-    # rewrite leftover
+                continue
+            yield rec
+
+def _read_outbox_snapshot():
+    """
+    Lê o outbox sob a trava de escrita: devolve [(linha_original, registro)] e
+    o tamanho lido em bytes (o que for anexado depois fica além desse ponto).
+    """
+    with outbox_write_lock(), open(OUTBOX_PATH, "rb") as f:
+        data = f.read()
+    entries = []
+    for ln in data.split(b"\n"):
+        try:
+            rec = orjson.loads(ln)
+        except Exception:
+            continue
+        entries.append((ln + b"\n", rec))
+    return entries, len(data)
+
+def _resend_outbox(api_base, token):
     try:
-        if retained:
-            with open(OUTBOX_PATH, "w", encoding="utf-8") as f:
-                for r in retained:
-                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
-        else:
-            os.remove(OUTBOX_PATH)
+        entries, snapshot_size = _read_outbox_snapshot()
     except Exception:
-        pass
-    return {"processed": processed, "left": len(retained)}
+        # Inclui FileNotFoundError: outbox vazio/removido entre a checagem e a leitura
+        return {"processed": 0, "left": 0}
+    # Índices (em entries) dos registros ainda não entregues
+    pending = list(range(len(entries)))
+    # try backend if provided (o /api/webhook recebe um cliente por requisição;
+    # os envios saem em paralelo pela mesma sessão HTTP, com conexões reaproveitadas).
+    # Corpo serializado com orjson (data=), sem o json.dumps interno do requests
+    if api_base and entries:
+        # X-Sync: só conta como entregue o que foi gravado no banco (200/201); um
+        # 202 indicaria apenas a fila em memória da API, que se perde num crash
+        headers = {"Content-Type": "application/json", "X-Sync": "true"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        url = api_base.rstrip("/") + "/api/webhook"
+        session = http_session()
+        backend_down = threading.Event()
+
+        def _send(entry):
+            if backend_down.is_set():
+                return False
+            try:
+                r = session.post(url, data=orjson.dumps(entry[1].get("payload", {})), headers=headers, timeout=8)
+                return r.status_code in (200, 201)
+            except ConnectionError:
+                # Backend fora do ar: os envios restantes nem são tentados
+                backend_down.set()
+            except Exception:
+                pass
+            return False
+
+        with ThreadPoolExecutor(max_workers=OUTBOX_SEND_CONCURRENCY) as executor:
+            sent = list(executor.map(_send, entries))
+        pending = [n for n, ok in enumerate(sent) if not ok]
+    # O que sobrou vai direto ao Supabase em um único insert em lote
+    failed = try_save_batch_to_supabase([entries[n][1].get("payload", {}) for n in pending])
+    retained = [entries[pending[i]][0] for i in failed]
+    processed = len(entries) - len(retained)
+    # rewrite leftover (bytes originais de cada linha) + o que foi anexado por
+    # save_outbox durante os envios, lido e trocado sob a mesma trava de escrita
+    with outbox_write_lock():
+        try:
+            with open(OUTBOX_PATH, "rb") as f:
+                f.seek(snapshot_size)
+                appended = f.read()
+        except FileNotFoundError:
+            appended = b""
+        _replace_outbox(retained + [appended] if appended else retained)
+    return {"processed": processed, "left": len(retained) + appended.count(b"\n")}
 
 
 def resend_single_outbox_record(rec, api_base=None, token=None):
@@ -200,10 +517,11 @@ def resend_single_outbox_record(rec, api_base=None, token=None):
     # try backend first
     if api_base:
         try:
-            headers = {"Content-Type": "application/json"}
+            # X-Sync + 200/201: só remove do outbox o que já está no banco
+            headers = {"Content-Type": "application/json", "X-Sync": "true"}
             if token:
                 headers["Authorization"] = f"Bearer {token}"
-            r = requests.post(api_base.rstrip("/") + "/api/webhook", json=payload, headers=headers, timeout=8)
+            r = http_session().post(api_base.rstrip("/") + "/api/webhook", data=orjson.dumps(payload), headers=headers, timeout=8)
             if r.status_code in (200, 201):
                 return True, "sent_backend"
         except Exception:
@@ -217,77 +535,209 @@ def resend_single_outbox_record(rec, api_base=None, token=None):
     return False, info
 
 
-def remove_outbox_entry_by_index(idx):
-    """Remove a single outbox entry by its index (0-based)."""
-    if not os.path.exists(OUTBOX_PATH):
-        return False
+def _replace_outbox(lines):
+    """
+    Troca o conteúdo do outbox pelas linhas (bytes) informadas: grava um arquivo
+    temporário e faz os.replace (atômico); sem linhas, remove o outbox.
+    Chamar com outbox_write_lock() em mãos.
+    """
+    tmp_path = None
     try:
-        with open(OUTBOX_PATH, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        if idx < 0 or idx >= len(lines):
-            return False
-        del lines[idx]
         if lines:
-            with open(OUTBOX_PATH, "w", encoding="utf-8") as f:
+            # Temporário único no mesmo diretório (os.replace não cruza sistemas de arquivos)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(OUTBOX_PATH),
+                                            prefix=".pending_webhooks-", suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
                 f.writelines(lines)
+            os.replace(tmp_path, OUTBOX_PATH)
+            tmp_path = None
         else:
-            os.remove(OUTBOX_PATH)
+            try:
+                os.remove(OUTBOX_PATH)
+            except FileNotFoundError:
+                pass
         return True
     except Exception:
         return False
+    finally:
+        # Falha no meio da gravação: não deixa o temporário para trás
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
 
-# Tenta re-enviar uma vez ao iniciar (silencioso)
-API_BASE_START = st.secrets.get("API_BASE_URL") if "API_BASE_URL" in st.secrets else os.getenv("API_BASE_URL", None)
-API_TOKEN_START = st.secrets.get("API_SECRET_TOKEN") if "API_SECRET_TOKEN" in st.secrets else os.getenv("API_SECRET_TOKEN", None)
-if API_BASE_START or supabase:
-    _res = resend_outbox_once(api_base=API_BASE_START, token=API_TOKEN_START)
-    if _res.get("processed", 0) > 0:
-        st.info(f"{_res['processed']} registro(s) pendentes processados automaticamente.")
+def _remove_outbox_entries(targets):
+    """
+    Remove do arquivo as linhas iguais aos registros em `targets` (cada um uma
+    vez). Relê o arquivo sob a trava de escrita: appends mais novos que a lista
+    da sessão são preservados e o que um reenvio já removeu não volta.
+    """
+    remaining = list(targets)
+    with outbox_write_lock():
+        try:
+            with open(OUTBOX_PATH, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return True
+        kept = []
+        for ln in data.split(b"\n"):
+            if not ln:
+                continue
+            try:
+                rec = orjson.loads(ln)
+            except Exception:
+                rec = None
+            if rec is not None and rec in remaining:
+                remaining.remove(rec)
+                continue
+            kept.append(ln + b"\n")
+        return _replace_outbox(kept)
+
+
+def _outbox_mtime():
+    """mtime (ns) do outbox em um único stat(); None se o arquivo não existe."""
+    try:
+        return os.stat(OUTBOX_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def load_outbox():
+    """
+    Registros do outbox, lidos do disco só quando o arquivo muda.
+    A lista fica em st.session_state; a aba renderiza e edita a cópia em memória.
+    """
+    mtime = _outbox_mtime()
+    if st.session_state.get("outbox_mtime") != mtime or "outbox_records" not in st.session_state:
+        try:
+            records = list(iter_outbox()) if mtime is not None else []
+        except FileNotFoundError:
+            records = []
+        st.session_state["outbox_records"] = records
+        st.session_state["outbox_mtime"] = mtime
+    return st.session_state["outbox_records"]
+
+
+def _remove_outbox_records(indices):
+    """
+    Remove do arquivo as entradas (índices 0-based da lista da sessão), por
+    conteúdo. Chamar com outbox_lock() em mãos.
+    """
+    records = st.session_state.get("outbox_records", [])
+    indices = set(indices)
+    if not indices or any(idx < 0 or idx >= len(records) for idx in indices):
+        return False
+    if not _remove_outbox_entries([records[idx] for idx in indices]):
+        return False
+    # Força a releitura do arquivo no próximo load_outbox
+    st.session_state.pop("outbox_records", None)
+    return True
+
+
+def remove_outbox_records(indices):
+    """
+    Remove entradas (índices 0-based) do outbox sob a trava dos reenvios.
+    Devolve None se um reenvio estiver em andamento.
+    """
+    with outbox_lock() as locked:
+        if not locked:
+            return None
+        return _remove_outbox_records(indices)
+
+# Reenvio automático do outbox em segundo plano (não atrasa a renderização):
+# no máximo uma vez a cada OUTBOX_RESEND_INTERVAL segundos por sessão, e só
+# depois que a tentativa anterior terminou. O resultado é avisado no próximo rerun.
+# O rearme periódico depende das travas (fcntl) que serializam o reenvio com
+# save_outbox/remove_outbox_records; sem elas, só a primeira tentativa da sessão.
+OUTBOX_RESEND_INTERVAL = 60
+OUTBOX_RESEND_REARM = fcntl is not None
+
+def _resend_outbox_background(api_base, token, result):
+    try:
+        result.update(resend_outbox_once(api_base=api_base, token=token))
+    finally:
+        result["done"] = True
+
+API_BASE_START, API_TOKEN_START = api_settings()
+_res = st.session_state.get("outbox_resend")
+if _res and _res.get("processed", 0) > 0 and not _res.get("notified"):
+    _res["notified"] = True
+    st.info(f"{_res['processed']} registro(s) pendentes processados automaticamente.")
+if (API_BASE_START or supabase) and _outbox_mtime() is not None and (
+        _res is None or (OUTBOX_RESEND_REARM and _res.get("done")
+                         and time.time() - _res["at"] > OUTBOX_RESEND_INTERVAL)):
+    st.session_state["outbox_resend"] = {"at": time.time()}
+    threading.Thread(target=_resend_outbox_background,
+                     args=(API_BASE_START, API_TOKEN_START, st.session_state["outbox_resend"]),
+                     daemon=True).start()
 
 # --- LAYOUT: Abas ---
 st.title("🚀 Painel de Controle - MVP Automação")
-tabs = st.tabs(["Visão Geral", "Enviar Webhook (form)", "Tarefas / Ações", "Pendentes / Outbox", "Logs / Auditoria"])
+if st.button("🔄 Atualizar Dados"):
+    fetch_table.clear()
+    fetch_clientes_page.clear()
+    fetch_clientes_metricas.clear()
+    fetch_clientes_overview.clear()
+    st.rerun()
+# Seleção de seção em vez de st.tabs: o Streamlit executa todos os blocos de
+# st.tabs a cada rerun; assim só a seção visível busca e processa seus dados
+SECOES = ["Visão Geral", "Enviar Webhook (form)", "Tarefas / Ações", "Pendentes / Outbox", "Logs / Auditoria"]
+secao = st.radio("Seção", SECOES, horizontal=True, key="active_tab", label_visibility="collapsed")
 
 # ----- ABA 1: Visão Geral -----
-with tabs[0]:
+if secao == "Visão Geral":
     st.header("📋 Visão Geral")
-    df_clientes = get_table("clientes")
-    if not df_clientes.empty:
-        for col in ["data_primeira_compra", "proxima_acao", "ultima_acao"]:
-            if col in df_clientes.columns:
-                df_clientes[col + "_pretty"] = df_clientes[col].apply(pretty_datetime)
-        if "data_primeira_compra" in df_clientes.columns:
-            df_clientes["dias_desde_compra"] = df_clientes["data_primeira_compra"].apply(days_since)
-        # format cpf for display (masked)
-        if 'cpf' in df_clientes.columns:
-            df_clientes['cpf_pretty'] = df_clientes['cpf'].apply(mask_cpf)
-        def precisa_acao(row):
-            pa = row.get("proxima_acao")
-            if not pa:
-                return "Sem agenda"
-            try:
-                pa_date = pd.to_datetime(pa)
-                if pa_date <= pd.Timestamp.now():
-                    return "Hoje / Atrasado"
-                return "Agendado"
-            except Exception:
-                return "Desconhecido"
-        df_clientes["status_acao"] = df_clientes.apply(precisa_acao, axis=1)
+    if supabase:
+        try:
+            metricas = fetch_clientes_metricas()
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Total de Clientes", metricas["total"])
+            col2.metric("Com próxima ação hoje/atrasada", metricas["hoje_atrasado"])
+            col3.metric("Sem próxima ação", metricas["sem_agenda"])
+        except Exception as e:
+            st.error(f"Erro ao calcular métricas de clientes: {e}")
 
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Total de Clientes", len(df_clientes))
-        col2.metric("Com próxima ação hoje/atrasada", int((df_clientes['status_acao']=="Hoje / Atrasado").sum()))
-        col3.metric("Sem próxima ação", int((df_clientes['status_acao']=="Sem agenda").sum()))
+    # Cursores da paginação: último id de cada página já visitada
+    page_size = st.selectbox("Clientes por página", CLIENTES_PAGE_SIZES, index=1, key="clientes_page_size")
+    if st.session_state.get("clientes_cursors_size") != page_size:
+        st.session_state["clientes_cursors"] = [None]
+        st.session_state["clientes_cursors_size"] = page_size
+    cursors = st.session_state["clientes_cursors"]
 
+    df_clientes = pd.DataFrame()
+    if supabase:
+        try:
+            df_clientes = fetch_clientes_overview(cursors[-1], page_size, CLIENTES_COLUMNS)
+        except Exception as e:
+            st.error(f"Erro ao buscar dados de clientes: {e}")
+    if not df_clientes.empty:
         display_cols = ["id", "nome", "cpf_pretty", "telefone", "status", "data_primeira_compra_pretty",
-                "dias_desde_compra", "proxima_acao_pretty", "ultima_acao_pretty", "status_acao", "observacoes"]
+                "dias_desde_compra", "proxima_acao_pretty", "ultima_acao_pretty", "last_followup_at_pretty", "status_acao", "observacoes"]
         display_cols = [c for c in display_cols if c in df_clientes.columns]
-        st.dataframe(df_clientes[display_cols].rename(columns=lambda x: x.replace("_pretty", "")), use_container_width=True)
+        display_names = [c.replace("_pretty", "") for c in display_cols]
+        st.dataframe(df_clientes.loc[:, display_cols].set_axis(display_names, axis=1, copy=False),
+                     use_container_width=True, column_config=CLIENTES_COLUMN_CONFIG)
+
+        nav_prev, nav_info, nav_next = st.columns([1, 2, 1])
+        if nav_prev.button("⬅️ Anterior", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        nav_info.caption(f"Página {len(cursors)}")
+        if nav_next.button("Próxima ➡️", disabled=len(df_clientes) < page_size):
+            cursors.append(int(df_clientes["id"].iloc[-1]))
+            st.rerun()
+    elif len(cursors) > 1:
+        st.info("Não há mais clientes.")
+        if st.button("⬅️ Voltar ao início"):
+            st.session_state["clientes_cursors"] = [None]
+            st.rerun()
     else:
         st.info("Nenhum cliente encontrado no banco de dados ainda.")
 
 # ----- ABA 2: Enviar Webhook (form) -----
-with tabs[1]:
+if secao == "Enviar Webhook (form)":
     st.header("📨 Enviar novo cliente")
     st.markdown("Formulário amigável para cadastrar clientes. O sistema tentará enviar ao backend; se indisponível, salva direto no banco; se necessário, guarda localmente para reenvio automático.")
     # Tipo de cliente e busca por CPF (fora do form para autocomplete)
@@ -298,7 +748,6 @@ with tabs[1]:
         cols_search = st.columns([2,1])
         cpf_search = cols_search[0].text_input("CPF (apenas números)", value=prefill.get("cpf",""))
         if cols_search[1].button("Buscar por CPF"):
-            from utils.validators import sanitize_cpf, validate_cpf
             cpf_digits = sanitize_cpf(cpf_search)
             ok, err = validate_cpf(cpf_digits)
             if not ok:
@@ -306,11 +755,12 @@ with tabs[1]:
             else:
                 # procura no Supabase por cpf
                 try:
-                    resp = supabase.table('clientes').select('*').eq('cpf', cpf_digits).limit(1).execute()
-                    data = getattr(resp, 'data', None) or []
-                    if data:
-                        client = data[0]
+                    client = find_client_by_cpf(cpf_digits)
+                    if client:
                         st.session_state['prefill_client'] = client
+                        # Valores vão direto para as chaves dos widgets (sem value=)
+                        for key, col in FORM_PREFILL_FIELDS.items():
+                            st.session_state[key] = client.get(col) or ""
                         st.experimental_rerun()
                     else:
                         st.info("Cliente não encontrado. Preencha os dados manualmente.")
@@ -318,10 +768,10 @@ with tabs[1]:
                     st.error(f"Erro na busca: {e}")
 
     with st.form("webhook_form"):
-        # prefill values if present
-        nome = st.text_input("Nome completo", value=prefill.get("nome",""))
-        telefone = st.text_input("Telefone", value=prefill.get("telefone",""))
-        email = st.text_input("Email (opcional)", value=prefill.get("email",""))
+        # Valores pré-preenchidos ficam no session_state (ver FORM_PREFILL_FIELDS)
+        nome = st.text_input("Nome completo", key="form_nome")
+        telefone = st.text_input("Telefone", key="form_telefone")
+        email = st.text_input("Email (opcional)", key="form_email")
 
         status_options = ["Novo Cliente - 1 compra", "Em follow-up", "Recorrente", "Perdido", "Outro..."]
         status_sel = st.selectbox("Status (padrões)", status_options, index=0)
@@ -337,7 +787,7 @@ with tabs[1]:
             data_compra = st.date_input("Data desta compra", value=None)
         procedimento = st.text_input("Procedimento", "")
         valor_pago = st.number_input("Valor pago", min_value=0.0, step=0.01, format="%.2f")
-        observacoes = st.text_area("Observações", value=prefill.get("observacoes",""))
+        observacoes = st.text_area("Observações", key="form_observacoes")
 
         # show CPF in form for existing as read-only if prefilled
         if cliente_tipo == "Existente":
@@ -366,43 +816,35 @@ with tabs[1]:
         submitted = st.form_submit_button("Enviar")
 
     if submitted:
-        API_BASE = st.secrets.get("API_BASE_URL") if "API_BASE_URL" in st.secrets else os.getenv("API_BASE_URL", "http://localhost:5000")
-        TOKEN = st.secrets.get("API_SECRET_TOKEN") if "API_SECRET_TOKEN" in st.secrets else os.getenv("API_SECRET_TOKEN", "")
+        API_BASE, TOKEN = api_settings()
+        if API_BASE is None:
+            API_BASE = "http://localhost:5000"
         url = API_BASE.rstrip("/") + "/api/webhook" if API_BASE else None
 
-        payload = {
+        # Monta o payload de uma vez, sem os campos opcionais vazios (None)
+        payload = {k: v for k, v in {
             "nome": nome,
             "telefone": telefone,
             "email": email,
             "status": status or "Novo Cliente - 1 compra",
             "procedimento": procedimento,
             "valor_pago": float(valor_pago) if valor_pago else None,
-            "observacoes": observacoes
-        }
+            "observacoes": observacoes,
+            "data_primeira_compra": data_compra.strftime("%d/%m/%Y") if data_compra else None,
+            "proxima_acao": proxima_acao_dt.isoformat() if proxima_acao_dt else None,
+        }.items() if v is not None}
 
         # include cpf when available
         cpf_field = prefill.get('cpf') if prefill.get('cpf') else (cpf_search or None)
         # validate CPF if present (existing clients require valid CPF)
         validation_failed = False
         if cpf_field:
-            from utils.validators import sanitize_cpf, validate_cpf
             cpf_digits = sanitize_cpf(cpf_field)
             ok, err = validate_cpf(cpf_digits)
             if not ok:
                 st.error(f"CPF inválido: {err}")
                 validation_failed = True
-        if cpf_field:
-            from utils.validators import sanitize_cpf
-            payload['cpf'] = sanitize_cpf(cpf_field)
-
-        if data_compra:
-            payload["data_primeira_compra"] = data_compra.strftime("%d/%m/%Y")
-
-        if proxima_acao_dt:
-            try:
-                payload["proxima_acao"] = proxima_acao_dt.isoformat()
-            except Exception:
-                payload["proxima_acao"] = None
+            payload['cpf'] = cpf_digits
 
         # Se o usuário marcou criar ação agora, iremos tentar criar ação e atualizar ultima_acao
         agora_iso = datetime.now().isoformat()
@@ -410,7 +852,8 @@ with tabs[1]:
             # marca que houve uma ação agora
             payload["ultima_acao"] = agora_iso
 
-        headers = {"Content-Type": "application/json"}
+        # X-Sync: o formulário precisa do client_id para criar as ações em seguida
+        headers = {"Content-Type": "application/json", "X-Sync": "true"}
         if TOKEN:
             headers["Authorization"] = f"Bearer {TOKEN}"
         if dry_run:
@@ -432,8 +875,8 @@ with tabs[1]:
             # try backend when configured
             elif url and not dry_run:
                 try:
-                    resp = requests.post(url, json=payload, headers=headers, timeout=10)
-                    if resp.status_code in (200, 201):
+                    resp = http_session().post(url, data=orjson.dumps(payload), headers=headers, timeout=10)
+                    if resp.status_code in (200, 201, 202):
                         client_saved = True
                         try:
                             j = resp.json()
@@ -477,16 +920,51 @@ with tabs[1]:
                     save_outbox(payload, {"error": "no_api_url", "fallback_info": info})
                     st.warning("Registro salvo localmente. Configure API_BASE_URL ou verifique conexão para processar.")
 
-        # Se foi criado/registrado com sucesso e o usuário pediu ação imediata, cria a ação
+        # Monta a ação imediata, a ação de compra (cliente existente com "data desta
+        # compra") e o resumo do cliente; tudo vai ao banco em uma única RPC
         action_created = False
-        if client_saved and criar_acao and not dry_run:
-            action_payload = {
-                "id_cliente": client_id,
-                "tipo": acao_tipo,
-                "conteudo": acao_conteudo,
-                "data": agora_iso,
-                "resultado": acao_resultado
-            }
+        action_payload = None
+        purchase_action = None
+        client_update = None
+        if client_saved and not dry_run:
+            if criar_acao:
+                action_payload = {
+                    "id_cliente": client_id,
+                    "tipo": acao_tipo,
+                    "conteudo": acao_conteudo,
+                    "data": agora_iso,
+                    "resultado": acao_resultado
+                }
+                client_update = {'ultima_acao': agora_iso}
+            if cliente_tipo == "Existente" and data_compra:
+                try:
+                    dt_str = data_compra.strftime('%Y-%m-%d')
+                except Exception:
+                    dt_str = None
+                purchase_content = f"Procedimento: {procedimento} | Valor: {valor_pago} | Data: {dt_str}"
+                purchase_action = {
+                    'id_cliente': client_id,
+                    'tipo': 'compra',
+                    'conteudo': purchase_content,
+                    'data': agora_iso,
+                    'resultado': 'comprou'
+                }
+                # update cliente resumo (procedimento, valor_pago, ultima_acao)
+                client_update = {'ultima_acao': agora_iso}
+                if procedimento:
+                    client_update['procedimento'] = procedimento
+                if valor_pago:
+                    client_update['valor_pago'] = float(valor_pago)
+
+        rpc_done = False
+        if client_id and (action_payload or purchase_action):
+            rpc_done, rpc_info, rpc_result = try_register_actions_supabase(
+                client_id, action_payload, purchase_action, client_update)
+            if rpc_done and action_payload:
+                action_created = bool(rpc_result.get("id_acao"))
+
+        # Fallback (função ainda não criada no banco): uma requisição por passo
+        if not rpc_done and action_payload:
             a_saved, a_info, a_rec = try_insert_action_supabase(action_payload)
             if a_saved:
                 action_created = True
@@ -496,136 +974,154 @@ with tabs[1]:
                         supabase.table('clientes').update({'ultima_acao': agora_iso}).eq('id', client_id).execute()
                 except Exception:
                     pass
-
-        # If existing client and user filled a "data desta compra", create a purchase action and update client summary
-        if client_saved and cliente_tipo == "Existente" and data_compra and not dry_run:
-            try:
-                dt_str = data_compra.strftime('%Y-%m-%d')
-            except Exception:
-                dt_str = None
-            purchase_content = f"Procedimento: {procedimento} | Valor: {valor_pago} | Data: {dt_str}"
-            purchase_action = {
-                'id_cliente': client_id,
-                'tipo': 'compra',
-                'conteudo': purchase_content,
-                'data': agora_iso,
-                'resultado': 'comprou'
-            }
+        if not rpc_done and purchase_action:
             try:
                 try_insert_action_supabase(purchase_action)
             except Exception:
                 pass
-            # update cliente resumo (procedimento, valor_pago, ultima_acao)
             try:
-                upd = {}
-                if procedimento:
-                    upd['procedimento'] = procedimento
-                if valor_pago:
-                    upd['valor_pago'] = float(valor_pago)
-                upd['ultima_acao'] = agora_iso
-                if upd and client_id:
-                    supabase.table('clientes').update(upd).eq('id', client_id).execute()
+                if client_update and client_id:
+                    supabase.table('clientes').update(client_update).eq('id', client_id).execute()
             except Exception:
                 pass
 
         # Feedback amigável
         if client_saved:
+            # Novo registro: descarta o cache para a Visão Geral refletir a inserção
+            fetch_table.clear()
+            fetch_clientes_page.clear()
+            fetch_clientes_overview.clear()
+            fetch_clientes_metricas.clear()
+            find_client_by_cpf.clear()
             msg = "Cliente registrado com sucesso."
             if action_created:
                 msg += " Ação criada."
             st.success(msg)
         else:
             with st.expander("Dados enviados (cópia)"):
-                st.code(json.dumps(payload, ensure_ascii=False, indent=2))
-            if os.path.exists(OUTBOX_PATH):
+                st.code(orjson.dumps(payload, option=orjson.OPT_INDENT_2).decode())
+            if _outbox_mtime() is not None:
                 st.info("Há registros pendentes. Eles serão reenviados automaticamente quando possível.")
                 if st.button("Tentar reenviar pendentes agora"):
                     res = resend_outbox_once(api_base=API_BASE if API_BASE else None, token=TOKEN if TOKEN else None)
                     st.info(f"Processados: {res.get('processed',0)} · Restantes: {res.get('left',0)}")
 
 # ----- ABA 3: Tarefas / Ações -----
-with tabs[2]:
+if secao == "Tarefas / Ações":
     st.header("📋 Tarefas / Ações Pendentes")
     st.markdown("Lista de ações pendentes usada pelos operadores. Fonte: view `vw_acoes_pendentes`.")
-    df_acoes = get_table("vw_acoes_pendentes", limit=500)
+    df_acoes = get_table("vw_acoes_pendentes", limit=500, columns=ACOES_PENDENTES_COLUMNS, order=("data", False))
     if not df_acoes.empty:
         if "data" in df_acoes.columns:
-            df_acoes["data_pretty"] = df_acoes["data"].apply(pretty_datetime)
+            df_acoes["data_pretty"] = pretty_datetime(df_acoes["data"])
         st.dataframe(df_acoes[["id","cliente_nome","cliente_telefone","tipo","conteudo","data_pretty","tipo_descricao"]], use_container_width=True)
         st.info("Para marcar resultado, use a interface administrativa ou crie endpoints que atualizem `acoes.resultado` via API.")
     else:
         st.info("Nenhuma ação pendente encontrada.")
 
 # ----- ABA 4: Pendentes / Outbox -----
-with tabs[3]:
+if secao == "Pendentes / Outbox":
     st.header("📥 Pendentes / Outbox")
-    st.markdown("Lista de envios locais que não foram processados. Você pode reenviar individualmente ao backend ou remover entradas.")
-    if not os.path.exists(OUTBOX_PATH):
+    st.markdown("Lista de envios locais que não foram processados. Selecione as linhas para reenviar ao backend ou remover entradas.")
+    try:
+        outbox_records = load_outbox()
+    except Exception as e:
+        st.error(f"Erro ao ler outbox: {e}")
+        outbox_records = []
+    if not outbox_records:
         st.info("Nenhum item pendente encontrado.")
     else:
-        try:
-            with open(OUTBOX_PATH, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-        except Exception as e:
-            st.error(f"Erro ao ler outbox: {e}")
-            lines = []
+        # Uma única tabela (com coluna de seleção) em vez de um expander e três
+        # botões por registro: o custo do rerun não cresce com o outbox
+        df_outbox = pd.DataFrame.from_records(
+            [{"selecionar": False,
+              "#": i,
+              "ts": rec.get("ts", "?"),
+              "nome": rec.get("payload", {}).get("nome", ""),
+              "telefone": rec.get("payload", {}).get("telefone", ""),
+              "motivo": (rec.get("meta") or {}).get("error", "")}
+             for i, rec in enumerate(outbox_records)],
+            columns=["selecionar", "#", "ts", "nome", "telefone", "motivo"])
+        # A chave muda quando o arquivo muda: seleções antigas não caem em outras linhas
+        edited = st.data_editor(df_outbox, hide_index=True, use_container_width=True,
+                                disabled=["#", "ts", "nome", "telefone", "motivo"],
+                                key=f"outbox_editor_{st.session_state.get('outbox_mtime')}")
+        selected = edited.loc[edited["selecionar"], "#"].tolist()
+        st.caption(f"{len(outbox_records)} pendente(s) · {len(selected)} selecionado(s).")
 
-        for i, ln in enumerate(lines):
-            try:
-                rec = json.loads(ln)
-            except Exception:
-                rec = {"ts": "?", "payload": {}}
-            ts = rec.get("ts", "?")
-            payload = rec.get("payload", {})
-            title = f"{i} — {ts} — {payload.get('nome', payload.get('telefone',''))}"
-            with st.expander(title, expanded=False):
-                st.json(payload)
-                cols = st.columns([1,1,1])
-                if cols[0].button(f"Reenviar {i}"):
-                    api_base = st.secrets.get("API_BASE_URL") if "API_BASE_URL" in st.secrets else os.getenv("API_BASE_URL", None)
-                    token = st.secrets.get("API_SECRET_TOKEN") if "API_SECRET_TOKEN" in st.secrets else os.getenv("API_SECRET_TOKEN", None)
-                    ok, info = resend_single_outbox_record(rec, api_base=api_base, token=token)
-                    if ok:
-                        removed = remove_outbox_entry_by_index(i)
-                        if removed:
-                            st.success("Reenviado e removido dos pendentes.")
+        cols = st.columns([1,1,1,2])
+        if cols[2].button("Reenviar todos"):
+            # Envio paralelo ao backend + um insert em lote no Supabase para o restante
+            api_base, token = api_settings()
+            res = resend_outbox_once(api_base=api_base, token=token)
+            if res.get("busy"):
+                st.warning("Já existe um reenvio em andamento. Tente novamente em instantes.")
+            else:
+                st.info(f"Processados: {res.get('processed',0)} · Restantes: {res.get('left',0)}")
+                if res.get("processed", 0):
+                    fetch_table.clear()
+                    fetch_clientes_page.clear()
+                    fetch_clientes_overview.clear()
+                    fetch_clientes_metricas.clear()
+        if cols[0].button("Reenviar selecionados", disabled=not selected):
+            api_base, token = api_settings()
+            sent = []
+            failures = []
+            # Mesma trava do reenvio automático: os dois não enviam o mesmo registro
+            with outbox_lock() as locked:
+                if not locked:
+                    st.warning("Já existe um reenvio em andamento. Tente novamente em instantes.")
+                else:
+                    for i in selected:
+                        ok, info = resend_single_outbox_record(outbox_records[i], api_base=api_base, token=token)
+                        if ok:
+                            sent.append(i)
+                        else:
+                            failures.append(f"{i}: {info}")
+                    if sent:
+                        if _remove_outbox_records(sent):
+                            st.success(f"{len(sent)} reenviado(s) e removido(s) dos pendentes.")
                         else:
                             st.success("Reenviado; não foi possível remover o item local (verifique permissões).")
-                        st.experimental_rerun()
-                    else:
-                        st.error(f"Falha ao reenviar: {info}")
-                if cols[1].button(f"Apagar {i}"):
-                    removed = remove_outbox_entry_by_index(i)
-                    if removed:
-                        st.success("Item removido do outbox.")
-                        st.experimental_rerun()
-                    else:
-                        st.error("Falha ao remover o item.")
-                if cols[2].button(f"Salvar como arquivo {i}"):
-                    # export payload as file
-                    fn = f"pending_{i}.json"
-                    try:
-                        with open(fn, "w", encoding="utf-8") as f:
-                            json.dump(payload, f, ensure_ascii=False, indent=2)
-                        st.success(f"Salvo em {fn}")
-                    except Exception as e:
-                        st.error(f"Erro ao salvar arquivo: {e}")
-
-# ----- ABA 4: Logs / Auditoria -----
-with tabs[3]:
+            if failures:
+                st.error("Falha ao reenviar: " + "; ".join(failures))
+            elif sent:
+                st.experimental_rerun()
+        if cols[1].button("Apagar selecionados", disabled=not selected):
+            removed = remove_outbox_records(selected)
+            if removed:
+                st.success(f"{len(selected)} item(ns) removido(s) do outbox.")
+                st.experimental_rerun()
+            elif removed is None:
+                st.warning("Já existe um reenvio em andamento. Tente novamente em instantes.")
+            else:
+                st.error("Falha ao remover os itens.")
+
+        # Detalhe de um registro (payload completo e exportação)
+        i = cols[3].selectbox("Ver registro", df_outbox["#"].tolist(),
+                              format_func=lambda n: f"{n} — {df_outbox.at[n, 'ts']} — {df_outbox.at[n, 'nome'] or df_outbox.at[n, 'telefone']}")
+        payload = outbox_records[i].get("payload", {})
+        with st.expander(f"Payload do registro {i}", expanded=False):
+            st.json(payload)
+            if st.button(f"Salvar como arquivo {i}"):
+                # export payload as file
+                fn = f"pending_{i}.json"
+                try:
+                    with open(fn, "wb") as f:
+                        f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
+                    st.success(f"Salvo em {fn}")
+                except Exception as e:
+                    st.error(f"Erro ao salvar arquivo: {e}")
+
+# ----- ABA 5: Logs / Auditoria -----
+if secao == "Logs / Auditoria":
     st.header("📜 Logs / Auditoria")
-    st.markdown("Mostra os últimos registros da tabela `auditoria` para rastrear alterações.")
-    df_logs = get_table("auditoria", limit=200)
+    st.markdown("Mostra os últimos registros da tabela `auditoria` (via `vw_auditoria_recente`) para rastrear alterações.")
+    # dados_novos já vem truncado pelo Postgres; os 200 mais recentes via ORDER BY + LIMIT
+    df_logs = get_table("vw_auditoria_recente", limit=200, columns=AUDITORIA_COLUMNS, order=("data_operacao", True))
     if not df_logs.empty:
-        def short_json(x):
-            try:
-                s = str(x)
-                return (s[:300] + "...") if len(s) > 300 else s
-            except Exception:
-                return str(x)
-        for c in ["dados_antigos","dados_novos"]:
-            if c in df_logs.columns:
-                df_logs[c] = df_logs[c].apply(short_json)
+        # Data formatada na coluna inteira (um único parse vetorizado)
+        df_logs["data_operacao"] = pretty_datetime(df_logs["data_operacao"], "%Y-%m-%d %H:%M:%S")
         st.dataframe(df_logs[["data_operacao","tabela_afetada","operacao","id_registro","usuario","dados_novos"]], use_container_width=True)
     else:
-        st.info("Nenhum log encontrado ou tabela `auditoria` não existe no projeto.")
\ No newline at end of file
+        st.info("Nenhum log encontrado ou view `vw_auditoria_recente` não existe no projeto (rode database/schema.sql).")
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""
+Pool de conexões HTTP compartilhado para o client do Supabase.
+
+Usado pela API (services/database_service.py) e pelo painel Streamlit, para que
+as conexões TCP/TLS com o PostgREST sejam reaproveitadas entre as queries.
+"""
+import atexit
+import httpx
+
+
+def configure_http_pool(client, max_connections: int = 60, max_keepalive: int = 40) -> None:
+    """
+    Substitui a sessão HTTP do PostgREST por uma com pool de conexões ajustado.
+
+    Reaproveita conexões TCP/TLS entre chamadas, evitando um handshake por query
+    quando vários webhooks chegam ao mesmo tempo.
+
+    Args:
+        client: Client do Supabase (retornado por create_client)
+        max_connections: Máximo de conexões simultâneas com o PostgREST
+        max_keepalive: Conexões mantidas abertas (keep-alive) entre requisições
+    """
+    old_session = client.postgrest.session
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=60
+    )
+    session = httpx.Client(
+        base_url=old_session.base_url,
+        headers=old_session.headers,
+        timeout=httpx.Timeout(10.0, connect=3.0),
+        transport=httpx.HTTPTransport(http2=True, limits=limits, retries=3),
+        follow_redirects=True
+    )
+    client.postgrest.session = session
+    old_session.close()
+    atexit.register(session.close)
@@ -0,0 +1,28 @@
+"""
+Provider JSON do Flask baseado em orjson.
+
+Substitui o `json` da stdlib em `jsonify`/`request.get_json`, reduzindo o custo
+de serialização da listagem de clientes e do parse dos webhooks.
+"""
+import decimal
+import orjson
+from flask.json.provider import JSONProvider
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    """Converte tipos que o orjson não serializa nativamente."""
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    return str(obj)
+
+
+class ORJSONProvider(JSONProvider):
+    """Implementação de `JSONProvider` usando orjson."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
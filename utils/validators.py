@@ -2,9 +2,36 @@
 Utilitários de validação para dados de clientes.
 """
 import re
+import unicodedata
+from functools import lru_cache
 from typing import Tuple, Optional
 
+# Padrões compilados uma única vez (validadores rodam em todo webhook)
+_PHONE_CHARS_RE = re.compile(r'[^\d+]')
+_NON_DIGITS_RE = re.compile(r'\D')
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
 
+# Validadores/sanitizadores de telefone e CPF são funções puras: memoizados
+# para reenvios do mesmo payload (retries do webhook, reruns do painel).
+# Email fica de fora (alta cardinalidade).
+_VALIDATOR_CACHE_SIZE = 4096
+
+# Bytes removidos no caminho ASCII (bytes.translate é um único laço em C, sem o
+# interpretador de regex). Entradas não ASCII continuam nas regex acima, que
+# aceitam dígitos Unicode.
+_ASCII_NON_DIGITS = bytes(c for c in range(256) if not 48 <= c <= 57)
+_ASCII_PHONE_DROP = bytes(c for c in _ASCII_NON_DIGITS if c != ord('+'))
+
+
+def _strip_non_digits(texto: str, keep_plus: bool = False) -> str:
+    """Remove caracteres não numéricos (opcionalmente mantendo '+')."""
+    if texto.isascii():
+        drop = _ASCII_PHONE_DROP if keep_plus else _ASCII_NON_DIGITS
+        return texto.encode('ascii').translate(None, drop).decode('ascii')
+    return (_PHONE_CHARS_RE if keep_plus else _NON_DIGITS_RE).sub('', texto)
+
+
+@lru_cache(maxsize=_VALIDATOR_CACHE_SIZE)
 def validate_phone(telefone: str) -> Tuple[bool, Optional[str]]:
     """
     Valida formato de telefone brasileiro.
@@ -24,8 +51,12 @@ def validate_phone(telefone: str) -> Tuple[bool, Optional[str]]:
     if not telefone:
         return False, "Telefone não pode ser vazio"
     
-    # Remove caracteres não numéricos (exceto + no início)
-    telefone_limpo = re.sub(r'[^\d+]', '', telefone)
+    # Remove caracteres não numéricos (exceto + no início); entrada só com
+    # dígitos ASCII (caso comum em formulários) já está limpa
+    if telefone.isascii() and telefone.isdigit():
+        telefone_limpo = telefone
+    else:
+        telefone_limpo = _strip_non_digits(telefone, keep_plus=True)
     
     # Remove o + se existir
     if telefone_limpo.startswith('+'):
@@ -38,26 +69,27 @@ def validate_phone(telefone: str) -> Tuple[bool, Optional[str]]:
     # Valida comprimento (DDD + número)
     # DDD: 2 dígitos, Celular: 9 dígitos (começando com 9)
     # Fixo: 8 dígitos
-    if len(telefone_limpo) < 10 or len(telefone_limpo) > 11:
-        return False, f"Telefone deve ter entre 10 e 11 dígitos (com DDD). Recebido: {len(telefone_limpo)} dígitos"
+    n = len(telefone_limpo)
+    if n != 10 and n != 11:
+        return False, f"Telefone deve ter entre 10 e 11 dígitos (com DDD). Recebido: {n} dígitos"
     
-    # Valida DDD (deve estar entre 11 e 99)
+    # Valida DDD (deve estar entre 11 e 99; com 2 dígitos, basta o limite inferior)
     ddd = telefone_limpo[:2]
-    if not ddd.isdigit() or int(ddd) < 11 or int(ddd) > 99:
+    try:
+        ddd_valido = int(ddd) >= 11
+    except ValueError:
+        ddd_valido = False
+    if not ddd_valido:
         return False, f"DDD inválido: {ddd}"
     
-    # Valida se é celular (9 dígitos após DDD) ou fixo (8 dígitos)
-    numero = telefone_limpo[2:]
-    if len(numero) == 9:
+    # Celular (11 dígitos = DDD + 9) ou fixo (10 dígitos = DDD + 8)
+    if n == 11:
         # Celular deve começar com 9
-        if not numero.startswith('9'):
+        if telefone_limpo[2] != '9':
             return False, "Número de celular deve começar com 9"
-    elif len(numero) == 8:
+    elif telefone_limpo[2] in '01':
         # Fixo não deve começar com 0 ou 1
-        if numero.startswith('0') or numero.startswith('1'):
-            return False, "Número fixo inválido"
-    else:
-        return False, "Número deve ter 8 (fixo) ou 9 (celular) dígitos após o DDD"
+        return False, "Número fixo inválido"
     
     return True, None
 
@@ -75,26 +107,22 @@ def validate_email(email: str) -> Tuple[bool, Optional[str]]:
     if not email:
         return True, None  # Email é opcional
     
-    # Regex básico para validação de email
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    
-    if not re.match(pattern, email):
-        return False, "Formato de email inválido"
-    
-    # Validações adicionais
-    if len(email) > 254:  # Limite RFC 5321
+    # Limite RFC 5321 antes da regex: entradas enormes falham sem varrer o texto
+    if len(email) > 254:
         return False, "Email muito longo (máximo 254 caracteres)"
     
-    if email.count('@') != 1:
-        return False, "Email deve conter exatamente um @"
+    # Regex básico para validação de email. Ela já garante um único @ e que o
+    # email termina em letra (TLD), então só resta checar o ponto no início
+    if not _EMAIL_RE.match(email):
+        return False, "Formato de email inválido"
     
-    # Verifica se não começa ou termina com ponto
-    if email.startswith('.') or email.endswith('.'):
+    if email.startswith('.'):
         return False, "Email não pode começar ou terminar com ponto"
     
     return True, None
 
 
+@lru_cache(maxsize=_VALIDATOR_CACHE_SIZE)
 def sanitize_phone(telefone: str) -> str:
     """
     Sanitiza telefone removendo caracteres especiais e formatando.
@@ -105,8 +133,11 @@ def sanitize_phone(telefone: str) -> str:
     Returns:
         String com telefone limpo (apenas dígitos)
     """
-    # Remove tudo exceto dígitos
-    telefone_limpo = re.sub(r'\D', '', telefone)
+    # Remove tudo exceto dígitos (entrada só com dígitos ASCII já está limpa)
+    if telefone.isascii() and telefone.isdigit():
+        telefone_limpo = telefone
+    else:
+        telefone_limpo = _strip_non_digits(telefone)
     
     # Remove código do país se existir
     if telefone_limpo.startswith('55') and len(telefone_limpo) > 11:
@@ -134,14 +165,22 @@ def sanitize_email(email: str) -> str:
     return email_limpo
 
 
+@lru_cache(maxsize=_VALIDATOR_CACHE_SIZE)
 def sanitize_cpf(cpf: str) -> str:
-    """Remove caracteres não numéricos do CPF e retorna string com 11 dígitos quando possível."""
+    """Remove caracteres não numéricos do CPF e retorna string com 11 dígitos quando possível.
+
+    A saída contém apenas [0-9]: dígitos Unicode (ex.: '١') são convertidos
+    para o dígito ASCII equivalente.
+    """
     if not cpf:
         return ""
-    cpf_digits = re.sub(r'\D', '', cpf)
+    cpf_digits = _strip_non_digits(cpf)
+    if not cpf_digits.isascii():
+        cpf_digits = ''.join(str(unicodedata.decimal(c)) for c in cpf_digits)
     return cpf_digits
 
 
+@lru_cache(maxsize=_VALIDATOR_CACHE_SIZE)
 def validate_cpf(cpf: str) -> Tuple[bool, Optional[str]]:
     """Valida CPF (formato e dígitos verificadores).
 
@@ -152,19 +191,25 @@ def validate_cpf(cpf: str) -> Tuple[bool, Optional[str]]:
     cpf_digits = sanitize_cpf(cpf)
     if len(cpf_digits) != 11:
         return False, "CPF deve ter 11 dígitos"
+    # sanitize_cpf devolve só [0-9]. Trabalha sobre os 11 bytes: indexar bytes devolve int, sem criar strings
+    db = cpf_digits.encode('ascii')
     # Elimina CPFs com todos dígitos iguais
-    if cpf_digits == cpf_digits[0] * 11:
+    if db == db[:1] * 11:
         return False, "CPF inválido"
-
-    def calc_digit(digs):
-        s = sum(int(d) * w for d, w in zip(digs, range(len(digs)+1, 1, -1)))
-        r = (s * 10) % 11
-        return '0' if r == 10 else str(r)
-
-    first9 = cpf_digits[:9]
-    d1 = calc_digit(first9)
-    d2 = calc_digit(first9 + d1)
-    if cpf_digits[-2:] != d1 + d2:
+    # Dígitos como inteiros de uma vez (subtração de '0' direto nos bytes)
+    d = [b - 48 for b in db]
+
+    # 1º dígito: pesos 10..2 sobre os 9 primeiros (soma desenrolada, sem laço)
+    s1 = (10 * d[0] + 9 * d[1] + 8 * d[2] + 7 * d[3] + 6 * d[4]
+          + 5 * d[5] + 4 * d[6] + 3 * d[7] + 2 * d[8])
+    r1 = (s1 * 10) % 11
+    d1 = 0 if r1 == 10 else r1
+    # 2º dígito: pesos 11..2 = pesos 10..2 + 1 em cada um dos 9 primeiros
+    # e 2 sobre o 1º dígito, logo s2 = s1 + soma(9 primeiros) + 2*d1
+    s2 = s1 + sum(d[:9]) + 2 * d1
+    r2 = (s2 * 10) % 11
+    d2 = 0 if r2 == 10 else r2
+    if d[9] != d1 or d[10] != d2:
         return False, "CPF inválido"
     return True, None
 